@@ -0,0 +1,32 @@
+#!/usr/bin/env python
+# run from the repository root: python benchmarks/startup.py [repeats]
+import subprocess
+import sys
+import time
+
+STARTUP_COMMANDS = {
+    "import sss.commander": [sys.executable, "-c", "import sss.commander"],
+    "sss.py --help": [sys.executable, "sss.py", "--help"],
+    "import nmf backend": [sys.executable, "-c", "import sss.extractors.nmf"],
+    "import evaluation": [sys.executable, "-c", "import sss.evaluation"],
+}
+
+
+def measure(command: list[str], repeats: int) -> list[float]:
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        subprocess.run(command, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+if __name__ == "__main__":
+    repeats = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    for name, command in STARTUP_COMMANDS.items():
+        try:
+            timings = measure(command, repeats)
+        except subprocess.CalledProcessError:
+            print(f"{name:<24} failed, its dependencies are missing in this environment")
+            continue
+        print(f"{name:<24} best {min(timings):.3f}s  mean {sum(timings) / repeats:.3f}s")
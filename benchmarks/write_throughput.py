@@ -0,0 +1,44 @@
+#!/usr/bin/env python
+# run from the repository root: python benchmarks/write_throughput.py [seconds of audio] [repeats]
+import io
+import sys
+import tempfile
+import time
+from contextlib import redirect_stdout
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from sss.dataclasses import SaveWavParams, Instrument  # noqa: E402
+from sss.persistance import OUTPUT_FORMATS, result_file, result_path, save_results  # noqa: E402
+
+SAMPLE_RATE = 44_100
+
+
+def measure(wave: np.ndarray, output_format: str, repeats: int) -> tuple[list[float], int]:
+    timings = []
+    with tempfile.TemporaryDirectory() as output_dir:
+        save_params = SaveWavParams(sample_rate=SAMPLE_RATE, input_track="benchmark", output_path=output_dir,
+                                    output_format=output_format)
+        for _ in range(repeats):
+            with redirect_stdout(io.StringIO()):
+                start = time.perf_counter()
+                save_results(wave, Instrument.vocals, save_params)
+                timings.append(time.perf_counter() - start)
+        size = Path(result_file(result_path(Instrument.vocals, save_params), output_format)).stat().st_size
+    return timings, size
+
+
+if __name__ == "__main__":
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 180
+    repeats = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    # a separated stem is noise-like, which is close to the worst case for flac
+    wave = (np.random.default_rng(0).standard_normal((int(seconds * SAMPLE_RATE), 2)) * 0.1).astype(np.float32)
+    audio_seconds = len(wave) / SAMPLE_RATE
+    results = {output_format: measure(wave, output_format, repeats) for output_format in OUTPUT_FORMATS}
+    for output_format, (timings, size) in results.items():
+        print(f"{output_format:<5} best {min(timings):.3f}s  mean {sum(timings) / repeats:.3f}s  "
+              f"{size / 2**20:7.1f} MB  {audio_seconds / min(timings):6.0f}x realtime  "
+              f"{size / 2**20 / min(timings):7.1f} MB/s")
@@ -1,3 +1,4 @@
+import os
 import soundfile as sf
 import threading
 import functools
@@ -7,7 +8,7 @@ from PyQt5 import QtWidgets, QtCore
 from generated.gui_main_window_generated import Ui_MainWindow
 
 from sss.dataclasses import ExtractParams, EvalParams, ExtractionType
-from sss.commander import extract,  evaluate
+from sss.commander import iter_extract,  result_evaluator
 
 
 class ExtractManager(QtCore.QObject):
@@ -20,11 +21,17 @@ class ExtractManager(QtCore.QObject):
     def _execute(self, my_data, extract_params):
         self.started.emit()
 
-        my_data.audio_wave = extract(method=my_data.method, params=extract_params)
-
-        for (instrument, wave) in my_data.audio_wave:
-            if my_data.evaluation_references[instrument.value]:
-                my_data.evaluation_results[instrument.value] = evaluate(result_wave=wave, eval_params=EvalParams(my_data.evaluation_references[instrument.value]))
+        my_data.audio_wave = []
+        evaluated = []
+        with result_evaluator() as evaluator:
+            # evaluation of a stem runs while the next ones are separated
+            for (instrument, wave) in iter_extract(method=my_data.method, params=extract_params):
+                my_data.audio_wave.append((instrument, wave))
+                if my_data.evaluation_references[instrument.value]:
+                    evaluator.submit(wave, EvalParams(my_data.evaluation_references[instrument.value]))
+                    evaluated.append(instrument)
+            for instrument, instrument_results in zip(evaluated, evaluator.results()):
+                my_data.evaluation_results[instrument.value] = instrument_results
 
         self.finished.emit()
 
@@ -74,14 +81,16 @@ class GUIMain(Ui_MainWindow):
         self.my_data.method = self.extractionMethodComboBox.currentText().lower()
         # QCoreApplication.processEvents()
 
-        _, self.my_data.sr = sf.read(self.input_location)
+        self.my_data.sr = sf.info(self.input_location).samplerate
 
         extract_params = ExtractParams(
                         input_path=self.input_location,
                         instruments=self.my_data.extraction_type,
                         quality=self.qualityComboBox.currentText().lower(),
                         reverse=self.reverseCheckBox.isChecked() or self.extractionTypeComboBox.currentText().lower() == 'karaoke',
-                        max_iter=0)
+                        max_iter=0,
+                        # opt-in result cache, e.g. SSS_CACHE_DIR=~/.cache/sss
+                        cache_dir=os.environ.get('SSS_CACHE_DIR'))
 
         self.extractManager.started.connect(lambda: self.widget.setCurrentIndex(1))
         self.extractManager.finished.connect(lambda: self.widget.setCurrentIndex(2))
@@ -11,7 +11,16 @@ from PyQt5.QtGui import QIcon
 from generated.gui_save_window_generated import Ui_SaveWindow
 
 from sss.dataclasses import SaveWavParams, SaveEvalParams
-from sss.commander import save, save_eval
+from sss.commander import background_writer
+
+
+class SaveErrorReporter(QtCore.QObject):
+    failed = QtCore.pyqtSignal(str)
+
+    def watch(self, future):
+        # the callback runs on a writer thread, the signal delivers the error to the GUI thread
+        future.add_done_callback(lambda done: self.failed.emit(str(done.exception())) if done.exception() else None)
+        return future
 
 
 class GUISave(Ui_SaveWindow):
@@ -25,6 +34,9 @@ class GUISave(Ui_SaveWindow):
         self.dynamicWidgets = []
         self.player = QtMultimedia.QMediaPlayer()
         self.mean_eval = {'vocals': {}, 'drums': {}, 'bass': {}, 'other': {}}
+        self.writer = background_writer()
+        self.save_errors = SaveErrorReporter()
+        self.save_errors.failed.connect(self.save_failed_handler)
 
     def add_features(self, window, gui_main):
         self.window = window
@@ -94,12 +106,12 @@ class GUISave(Ui_SaveWindow):
         output_location = QtWidgets.QFileDialog.getExistingDirectory(self.window,
                                                                           "Choose separation output directory", " ")
         if output_location:
-            save(result_wave=self.my_data.audio_wave[index][1],
-                 instrument=self.my_data.audio_wave[index][0],
-                 save_params=SaveWavParams(
-                     sample_rate=self.my_data.sr,
-                     input_track=self.my_data.input_track_name,
-                     output_path=output_location))
+            self.save_errors.watch(self.writer.save_results(result_wave=self.my_data.audio_wave[index][1],
+                                                            instrument=self.my_data.audio_wave[index][0],
+                                                            save_params=SaveWavParams(
+                                                                sample_rate=self.my_data.sr,
+                                                                input_track=self.my_data.input_track_name,
+                                                                output_path=output_location)))
 
     def save_evaluation_handler(self, instrument):
         msgBox = QMessageBox()
@@ -116,8 +128,11 @@ class GUISave(Ui_SaveWindow):
         if msgBox.exec() == QMessageBox.Save:
             evaluation_location = QtWidgets.QFileDialog.getExistingDirectory(self.window, "Choose evaluation output directory", " ")
             if evaluation_location:
-                save_eval(eval_results=self.my_data.evaluation_results[instrument],
-                          save_eval_params=SaveEvalParams(evaluation_location + f'/{self.my_data.input_track_name}-{instrument}-eval.json'))
+                self.save_errors.watch(self.writer.save_evaluation(eval_results=self.my_data.evaluation_results[instrument],
+                                                                   save_params=SaveEvalParams(evaluation_location + f'/{self.my_data.input_track_name}-{instrument}-eval.json')))
+
+    def save_failed_handler(self, message):
+        QMessageBox.critical(self.window, "Saving failed", f'Could not save the file:\n{message}')
 
     def return_handler(self):
         self.timer.stop()
@@ -157,12 +172,15 @@ class GUISave(Ui_SaveWindow):
             if os.path.isfile(file):
                 os.remove(file)
 
-        save(result_wave=self.my_data.audio_wave[index][1],
-             instrument=self.my_data.audio_wave[index][0],
-             save_params=SaveWavParams(
-                 sample_rate=self.my_data.sr,
-                 input_track=self.my_data.input_track_name,
-                 output_path='temp_files'))
+        # the player needs the file, so this save is waited for
+        saved = self.save_errors.watch(self.writer.save_results(result_wave=self.my_data.audio_wave[index][1],
+                                                                instrument=self.my_data.audio_wave[index][0],
+                                                                save_params=SaveWavParams(
+                                                                    sample_rate=self.my_data.sr,
+                                                                    input_track=self.my_data.input_track_name,
+                                                                    output_path='temp_files')))
+        if saved.exception() is not None:
+            return
 
         ### TESTING  # todo: delete this block later; solve problem with player updating (when new .wav file has the same name)
         file_path = os.path.join(os.getcwd(), 'temp_file.wav')
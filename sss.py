@@ -3,20 +3,30 @@
 from pathlib import Path
 
 from sss.dataclasses import ExtractParams, SaveWavParams, EvalParams, SaveEvalParams, ExtractionType,  Pathname
-from sss.commander import extract, save, evaluate, save_eval
+from sss.commander import iter_extract, stream_extract, load_saved, result_evaluator, background_writer, OUTPUT_FORMATS
 
 import soundfile as sf
 
 import click
 
 
-def init_extract_params(input_file: Pathname, extraction_type: ExtractionType, reverse: bool, quality: str, max_iter: int):
+def init_extract_params(input_file: Pathname, extraction_type: ExtractionType, reverse: bool, quality: str, max_iter: int,
+                        joint: bool, tol: float, jobs: int, activations_dir: Pathname, segment: float,
+                        cache_dir: Pathname, cache_size: int, precision: str):
     return ExtractParams(
         input_path=input_file,
         instruments=extraction_type.to_instrument(),
         reverse=ExtractParams.should_reverse(reverse, extraction_type),
         quality=quality,
-        max_iter=max_iter
+        max_iter=max_iter,
+        joint=joint,
+        tol=tol,
+        jobs=jobs,
+        activations_dir=activations_dir,
+        segment=segment,
+        cache_dir=cache_dir,
+        cache_size=cache_size,
+        precision=precision
     )
 
 
@@ -30,34 +40,65 @@ def eval_args_valid_for_extract(extraction_type: ExtractionType, eval_data: tupl
               type=click.Choice(ExtractionType.__members__),
               callback=lambda _c, _p, v: getattr(ExtractionType, v) if v else None)
 @click.option('-m', '--method', default='nmf', help='extraction method',
-              type=click.Choice(['nmf', 'demucs', 'nussl'], case_sensitive=False))
+              type=click.Choice(['nmf', 'demucs', 'demucs-cli', 'nussl'], case_sensitive=False))
 @click.option('-q', '--quality', default='normal', help='choose extraction quality',
               type=click.Choice(['fast', 'normal', 'high'], case_sensitive=False))
 @click.option('-e', '--evaluation-data', default=None, nargs=2,
               type=click.Tuple([click.Path(exists=True), click.Path()]),
               multiple=True,
               help='extraction evaluation')
+@click.option('--eval-mode', default='bss', type=click.Choice(['bss', 'fast']),
+              help='bss: full BSS-eval with museval, fast: framewise SI-SDR only, other metrics left empty')
 @click.option('--reverse/--no-reverse', '-r/', default=False, help='reversed extraction')
 @click.option('-I', '--max-iter', default=None, type=click.IntRange(1,), help='maximum iterations number')
+@click.option('--tol', default=None, type=click.FloatRange(0,),
+              help='relative loss decrease below which nmf stops early (0 disables, default depends on quality)')
+@click.option('--joint/--no-joint', default=False, help='decompose all instruments at once with a stacked dictionary (nmf)')
+@click.option('-j', '--jobs', default=1, type=click.IntRange(1,), help='number of worker processes (nmf segments, demucs shifts)')
+@click.option('--activations-dir', default=None, type=click.Path(file_okay=False),
+              help='keep nmf activations here and refine them when the same track is run again')
+@click.option('--stream/--no-stream', default=False,
+              help='separate block by block and write results incrementally, in constant memory (nmf, demucs)')
+@click.option('--segment', default=None, type=click.FloatRange(1,),
+              help='length of streamed segments in seconds, implies --stream')
+@click.option('--precision', default='float64', type=click.Choice(['float32', 'float64']),
+              help='float precision of audio, spectrograms and dictionaries (nmf), float32 halves memory traffic')
+@click.option('--cache-dir', default=None, type=click.Path(file_okay=False),
+              help='reuse results of identical separations stored in this directory')
+@click.option('--cache-size', default=2048, type=click.IntRange(1,), help='cache size limit in MB')
+@click.option('-f', '--output-format', default='wav', type=click.Choice(OUTPUT_FORMATS),
+              help='format of the separated stems: 24-bit wav or flac, or raw float32 npy')
 @click.option('-o', '--output-file', default="results\\separated", type=click.Path(), help='output file location')
 @click.argument('input-file', type=click.Path(exists=True))
-def sss_command(extraction_type, method, quality, evaluation_data, reverse, max_iter, output_file, input_file):
-    extract_parameters = init_extract_params(input_file, extraction_type, reverse, quality, max_iter)
-    _, sr = sf.read(input_file)
+def sss_command(extraction_type, method, quality, evaluation_data, eval_mode, reverse, max_iter, tol, joint, jobs,
+                activations_dir, stream, segment, precision, cache_dir, cache_size, output_format, output_file, input_file):
+    extract_parameters = init_extract_params(input_file, extraction_type, reverse, quality, max_iter, joint, tol, jobs,
+                                             activations_dir, segment, cache_dir, cache_size, precision)
     save_parameters = SaveWavParams(output_path=output_file,
-                                    sample_rate=sr,
-                                    input_track=Path(input_file).stem)
+                                    sample_rate=sf.info(input_file).samplerate,
+                                    input_track=Path(input_file).stem,
+                                    output_format=output_format)
     
-    result_waves = extract(method,extract_parameters)
-    for instrument, wave in result_waves:
-        save(wave, instrument, save_parameters)
-
-    if evaluation_data and eval_args_valid_for_extract(extraction_type, evaluation_data, reverse):
-        for (_, wave), (eval_ref_path, eval_out_path) in zip(result_waves, evaluation_data):
-            eval_results = evaluate(wave, eval_params=EvalParams(ref_path=eval_ref_path))
-            save_eval(eval_results, save_eval_params=SaveEvalParams(output_path=eval_out_path))
-    else:
+    evaluation_valid = bool(evaluation_data) and eval_args_valid_for_extract(extraction_type, evaluation_data, reverse)
+    if not evaluation_valid:
         print("Omitting evaluation")
+        evaluation_data = ()
+
+    with background_writer() as writer, result_evaluator() as evaluator:
+        if stream or segment:
+            saved_results = stream_extract(method, extract_parameters, save_parameters)
+            for (_, path), (eval_ref_path, _) in zip(saved_results, evaluation_data):
+                evaluator.submit(load_saved(path, output_format), EvalParams(ref_path=eval_ref_path, mode=eval_mode))
+        else:
+            # every stem is written and its evaluation started as soon as it is separated, while the next one is computed
+            for index, (instrument, wave) in enumerate(iter_extract(method, extract_parameters)):
+                writer.save_results(wave, instrument, save_parameters)
+                if index < len(evaluation_data):
+                    evaluator.submit(wave, EvalParams(ref_path=evaluation_data[index][0], mode=eval_mode))
+
+        if evaluation_data:
+            for eval_results, (_, eval_out_path) in zip(evaluator.results(), evaluation_data):
+                writer.save_evaluation(eval_results, SaveEvalParams(output_path=eval_out_path))
 
 # todo (optional): example with multiple evaluation references
 
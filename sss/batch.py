@@ -0,0 +1,164 @@
+import glob
+import multiprocessing
+import os
+import time
+from collections import Counter
+from concurrent.futures import Future, ProcessPoolExecutor
+from contextlib import suppress
+from dataclasses import dataclass, field, replace
+from pathlib import Path
+from typing import Iterable
+
+import soundfile as sf
+
+from sss.commander import preload, iter_extract, result_evaluator, background_writer
+from sss.dataclasses import BatchParams, SaveWavParams, EvalParams, SaveEvalParams, Instrument, Pathname
+
+AUDIO_EXTENSIONS = {".wav", ".flac", ".ogg", ".aif", ".aiff"}
+MANIFEST_EXTENSIONS = {".txt", ".lst"}
+
+_batch_params: BatchParams = None
+_writer = None
+_evaluator = None
+_queued_tracks: multiprocessing.Queue = None
+
+
+@dataclass
+class TrackReport:
+    track: Pathname
+    seconds: float
+    error: str = None
+    # saves still running once the track is separated, they overlap with the separation of the next one
+    pending: list[Future] = field(default_factory=list, repr=False, compare=False)
+
+    def settle(self) -> "TrackReport":
+        """Waits for the track's saves; the first failed one fails the track, unless its separation failed before."""
+        for future in self.pending:
+            error = future.exception()
+            if error is not None and self.error is None:
+                self.error = f"{type(error).__name__}: {error}"
+        self.pending = []
+        return self
+
+
+def collect_tracks(sources: list[str]) -> list[Pathname]:
+    """Expands directories (recursively), manifests (one path per line) and glob patterns into audio files."""
+    def read_manifest(manifest: Path) -> list[Pathname]:
+        with open(manifest, encoding="UTF-8") as file:
+            lines = [line.strip() for line in file]
+        return [str(manifest.parent / line) for line in lines if line and not line.startswith("#")]
+
+    def expand(source: str) -> list[Pathname]:
+        path = Path(source)
+        if path.is_dir():
+            return sorted(str(file) for file in path.rglob("*") if file.suffix.lower() in AUDIO_EXTENSIONS)
+        if path.is_file():
+            return read_manifest(path) if path.suffix.lower() in MANIFEST_EXTENSIONS else [source]
+        return sorted(glob.glob(source, recursive=True))
+
+    return [track for source in sources for track in expand(source)]
+
+
+def track_names(tracks: list[Pathname]) -> list[str]:
+    # tracks sharing a file name (e.g. musdb's mixture.wav) are told apart by their directory
+    stem_counts = Counter(Path(track).stem for track in tracks)
+    return [Path(track).stem if stem_counts[Path(track).stem] == 1 else f"{Path(track).parent.name}-{Path(track).stem}"
+            for track in tracks]
+
+
+def matches_reference(instrument: Instrument, instruments: list[Instrument]) -> bool:
+    # the residual is musdb's other stem only when every other instrument is extracted, as in full extractions
+    return instrument is not Instrument.other or set(Instrument) - {Instrument.other} <= set(instruments)
+
+
+def init_worker(batch_params: BatchParams, queued_tracks: multiprocessing.Queue = None):
+    global _batch_params, _writer, _evaluator, _queued_tracks
+    _batch_params = batch_params
+    _queued_tracks = queued_tracks
+    _writer = background_writer()
+    # parallel batches already keep every core busy with tracks
+    _evaluator = result_evaluator(jobs=1 if batch_params.workers > 1 else None)
+    preload(batch_params.method, batch_params.extract_params)
+
+
+def process_track(track: Pathname, track_name: str) -> TrackReport:
+    start = time.perf_counter()
+    pending = []
+    try:
+        params = replace(_batch_params.extract_params, input_path=track,
+                         instruments=list(_batch_params.extract_params.instruments))
+        save_params = SaveWavParams(sample_rate=sf.info(track).samplerate, input_track=track_name,
+                                    output_path=_batch_params.output_path,
+                                    output_format=_batch_params.output_format)
+        evaluated = []
+        for instrument, wave in iter_extract(_batch_params.method, params):
+            pending.append(_writer.save_results(wave, instrument, save_params))
+            # references are expected next to the track, named after the instrument (musdb layout)
+            reference = Path(track).parent / f"{instrument.value}.wav"
+            if _batch_params.evaluate and reference.is_file() and matches_reference(instrument, params.instruments):
+                _evaluator.submit(wave, EvalParams(str(reference), _batch_params.eval_mode))
+                evaluated.append(instrument)
+        if evaluated:
+            for instrument, instrument_results in zip(evaluated, _evaluator.results()):
+                eval_path = os.path.join(_batch_params.output_path, f"{track_name}-{instrument.value}-eval.json")
+                pending.append(_writer.save_evaluation(instrument_results, SaveEvalParams(eval_path)))
+    except Exception as error:
+        # the failed track's evaluations must not be gathered with the next one's
+        with suppress(Exception):
+            _evaluator.results()
+        return TrackReport(track, time.perf_counter() - start, f"{type(error).__name__}: {error}", pending)
+    return TrackReport(track, time.perf_counter() - start, pending=pending)
+
+
+def process_tracks(tracks: Iterable[tuple[Pathname, str]]) -> list[TrackReport]:
+    """Separates (track, name) pairs one after another, the saves of each track are waited for after the next one."""
+    reports = []
+    for track, track_name in tracks:
+        reports.append(process_track(track, track_name))
+        if len(reports) > 1:
+            reports[-2].settle()
+    if reports:
+        reports[-1].settle()
+    return reports
+
+
+def process_queued_tracks() -> list[TrackReport]:
+    # workers take the next track when they are done, so long tracks do not hold back the others
+    return process_tracks(iter(_queued_tracks.get, None))
+
+
+def run_batch(tracks: list[Pathname], batch_params: BatchParams) -> list[TrackReport]:
+    names = track_names(tracks)
+    if batch_params.workers < 2:
+        init_worker(batch_params)
+        with _evaluator:
+            return process_tracks(zip(tracks, names))
+
+    queued_tracks = multiprocessing.Queue()
+    for track, name in zip(tracks, names):
+        queued_tracks.put((track, name))
+    for _ in range(batch_params.workers):
+        queued_tracks.put(None)
+    reports = {}
+    error = None
+    with ProcessPoolExecutor(max_workers=batch_params.workers, initializer=init_worker,
+                             initargs=(batch_params, queued_tracks)) as pool:
+        runs = [pool.submit(process_queued_tracks) for _ in range(batch_params.workers)]
+        for run in runs:
+            try:
+                reports.update((report.track, report) for report in run.result())
+            except Exception as run_error:
+                # a worker itself died, e.g. it ran out of memory
+                error = f"{type(run_error).__name__}: {run_error}"
+    # tracks left behind by dead workers must not keep this process from exiting
+    queued_tracks.cancel_join_thread()
+    return [reports.get(track) or TrackReport(track, 0.0, error) for track in tracks]
+
+
+def print_summary(reports: list[TrackReport], elapsed: float):
+    failed = [report for report in reports if report.error]
+    for report in failed:
+        print(f"Failed {report.track}: {report.error}")
+    succeeded = len(reports) - len(failed)
+    print(f"Separated {succeeded} of {len(reports)} tracks in {elapsed:.1f}s "
+          f"({succeeded / elapsed * 60 if elapsed else 0:.2f} tracks/minute)")
@@ -0,0 +1,94 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+from contextlib import suppress
+from pathlib import Path
+
+import numpy as np
+
+from sss.dataclasses import ExtractParams, ResultWaves, Instrument, Pathname
+from sss.models import model_version
+
+HASH_CHUNK_SIZE = 1 << 20
+CACHE_FORMAT_VERSION = 1
+
+
+def audio_hash(path: Pathname) -> str:
+    digest = hashlib.sha1()
+    with open(path, "rb") as file:
+        while chunk := file.read(HASH_CHUNK_SIZE):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def cache_key(method: str, params: ExtractParams) -> str:
+    """Content address of a separation: the same audio separated with the same settings and models."""
+    if params.audio is not None:
+        raise ValueError("Separations are cached by their input file, already decoded audio cannot be cached")
+    settings = {"format": CACHE_FORMAT_VERSION,
+                "audio": audio_hash(params.input_path),
+                "method": method,
+                "instruments": [instrument.value for instrument in params.instruments],
+                "reverse": params.reverse,
+                "joint": params.joint,
+                "quality": params.quality,
+                "max_iter": params.max_iter,
+                "tol": params.tol,
+                "segment": params.segment,
+                "precision": params.precision,
+                "model": model_version(method, params.instruments)}
+    return hashlib.sha1(json.dumps(settings, sort_keys=True).encode()).hexdigest()
+
+
+def load_cached_results(cache_dir: Pathname, key: str) -> ResultWaves:
+    """Memory-mapped stems of a cached separation, or None on a miss."""
+    entry = Path(cache_dir) / key
+    try:
+        with open(entry / "stems.json", encoding="UTF-8") as file:
+            instruments = json.load(file)
+        results = [(Instrument(instrument), np.load(entry / f"{index}.npy", mmap_mode="r"))
+                   for index, instrument in enumerate(instruments)]
+    except (FileNotFoundError, ValueError):
+        return None
+    # mtime marks the last use, eviction removes the least recently used entries first
+    with suppress(FileNotFoundError):
+        os.utime(entry)
+    print(f"Results loaded from cache {entry}")
+    return results
+
+
+def store_results(cache_dir: Pathname, key: str, results: ResultWaves, max_size_mb: int) -> ResultWaves:
+    Path(cache_dir).mkdir(parents=True, exist_ok=True)
+    # written aside and renamed, so concurrent runs never see a half-written entry
+    staging = Path(tempfile.mkdtemp(dir=cache_dir, prefix=".staging-"))
+    for index, (_, wave) in enumerate(results):
+        np.save(staging / f"{index}.npy", np.ascontiguousarray(wave))
+    with open(staging / "stems.json", "w", encoding="UTF-8") as file:
+        json.dump([instrument.value for instrument, _ in results], file)
+    try:
+        os.replace(staging, Path(cache_dir) / key)
+    except OSError:
+        # another process stored the same separation first
+        shutil.rmtree(staging, ignore_errors=True)
+    evict(cache_dir, max_size_mb * 2**20)
+    return results
+
+
+def evict(cache_dir: Pathname, max_size: int):
+    def entry_usage(entry: Path) -> tuple[float, int]:
+        # processes sharing the cache may evict an entry while it is being measured, it is skipped then
+        with suppress(FileNotFoundError):
+            return entry.stat().st_mtime, sum(file.stat().st_size for file in entry.iterdir())
+        return None
+
+    usages = [(entry, entry_usage(entry)) for entry in Path(cache_dir).iterdir()
+              if entry.is_dir() and not entry.name.startswith(".")]
+    usages = sorted(((entry, usage) for entry, usage in usages if usage is not None), key=lambda item: item[1][0])
+    total = sum(size for _, (_, size) in usages)
+    for entry, (_, size) in usages:
+        if total <= max_size:
+            break
+        shutil.rmtree(entry, ignore_errors=True)
+        total -= size
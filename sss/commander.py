@@ -1,28 +1,96 @@
 import warnings
 warnings.simplefilter('ignore')
 
-from sss.extractors.nmf import perform_nmf
-from sss.extractors.demucs import perform_demucs
-from sss.extractors.nussl import perform_nussl
+from importlib import import_module
+from typing import Iterator
 
-from sss.persistance import save_results, save_evaluation
-from sss.evaluation import evaluate_results
+from sss.persistance import AsyncWriter, OUTPUT_FORMATS, save_results, load_result, save_evaluation
 
 from sss.dataclasses import ResultWaves, ExtractParams, SaveWavParams, EvalParams, SaveEvalParams, AudioWave, Pathname, Instrument
 
+# backends are imported on their first dispatch, so a run only pays for the libraries it actually uses
+EXTRACTORS = {"nmf": ("sss.extractors.nmf", "perform_nmf"),
+              "demucs": ("sss.extractors.demucs", "perform_demucs"),
+              "demucs-cli": ("sss.extractors.demucs", "perform_demucs_cli"),
+              "nussl": ("sss.extractors.nussl", "perform_nussl")}
+# backends able to hand over each stem as soon as it is separated
+ITERATIVE_EXTRACTORS = {"nmf": ("sss.extractors.nmf", "iter_nmf"),
+                        "nussl": ("sss.extractors.nussl", "iter_nussl")}
+STREAMING_EXTRACTORS = {"nmf": ("sss.extractors.nmf", "stream_nmf"),
+                        "demucs": ("sss.extractors.demucs", "stream_demucs")}
+
+
+def load_backend(registry: dict, method: str):
+    module_name, function_name = registry[method]
+    return getattr(import_module(module_name), function_name)
+
+
+def preload(method: str, params: ExtractParams):
+    backend = import_module(EXTRACTORS[method][0])
+    if hasattr(backend, "preload"):
+        backend.preload(params)
+
 
 def extract(method: str, params: ExtractParams) -> ResultWaves:
-    methods = {"nmf": perform_nmf, "demucs": perform_demucs, "nussl": perform_nussl}
-    return methods[method](params)
+    return list(iter_extract(method, params))
+
+
+def iter_extract(method: str, params: ExtractParams) -> Iterator[tuple[Instrument, AudioWave]]:
+    """Yields the separated stems one by one, backends in ITERATIVE_EXTRACTORS hand each over as soon as it is ready."""
+    def separated_stems():
+        if method in ITERATIVE_EXTRACTORS:
+            return load_backend(ITERATIVE_EXTRACTORS, method)(params)
+        return iter(load_backend(EXTRACTORS, method)(params))
+
+    if params.cache_dir is None:
+        yield from separated_stems()
+        return
+
+    from sss.cache import cache_key, load_cached_results, store_results
+    key = cache_key(method, params)
+    cached = load_cached_results(params.cache_dir, key)
+    if cached is not None:
+        yield from cached
+        return
+    results = []
+    for stem in separated_stems():
+        results.append(stem)
+        yield stem
+    store_results(params.cache_dir, key, results, params.cache_size)
     
 
+def stream_extract(method: str, params: ExtractParams, save_params: SaveWavParams) -> list[tuple[Instrument, Pathname]]:
+    if method not in STREAMING_EXTRACTORS:
+        raise ValueError(f"Streaming extraction is not supported by {method}")
+    return load_backend(STREAMING_EXTRACTORS, method)(params, save_params)
+
+
 def save(result_wave: AudioWave, instrument: Instrument, save_params: SaveWavParams) -> Pathname:
     return save_results(result_wave, instrument, save_params)
+
+
+def load_saved(path: Pathname, output_format: str) -> AudioWave:
+    return load_result(path, output_format)
  
  
 def evaluate(result_wave: AudioWave, eval_params: EvalParams):
+    from sss.evaluation import evaluate_results
     return evaluate_results(result_wave, eval_params)
 
 
+def evaluate_all(result_waves: list[AudioWave], eval_params: list[EvalParams], jobs: int = None) -> list[tuple]:
+    from sss.evaluation import evaluate_all_results
+    return evaluate_all_results(result_waves, eval_params, jobs)
+
+
+def result_evaluator(jobs: int = None):
+    from sss.evaluation import ResultEvaluator
+    return ResultEvaluator(jobs)
+
+
 def save_eval(eval_results, save_eval_params: SaveEvalParams):
     return save_evaluation(eval_results, save_eval_params)
+
+
+def background_writer(workers: int = 2, max_pending: int = 4) -> AsyncWriter:
+    return AsyncWriter(workers, max_pending)
@@ -5,9 +5,9 @@ import numpy as np
 import numpy.typing as npt
 
 
-AudioWave = npt.NDArray[np.float_]
-MonoWave = npt.NDArray[np.float_]
-Spectrogram = npt.NDArray[np.float_]
+AudioWave = npt.NDArray[np.floating]
+MonoWave = npt.NDArray[np.floating]
+Spectrogram = npt.NDArray[np.floating]
 Pathname = str
 
 class Instrument(Enum):
@@ -18,6 +18,13 @@ class Instrument(Enum):
 
 ResultWaves = list[tuple[Instrument, AudioWave]]
 
+
+@dataclass
+class InputAudio:
+    samples: AudioWave  # (frames, channels)
+    sample_rate: int
+
+
 class ExtractionType(Enum):
     karaoke = "karaoke"
     bass = "bass"
@@ -45,6 +52,15 @@ class ExtractParams:
     reverse: bool
     quality: str
     max_iter: int
+    joint: bool = False
+    tol: float = None
+    jobs: int = 1
+    activations_dir: Pathname = None
+    segment: float = None
+    cache_dir: Pathname = None
+    cache_size: int = 2048
+    precision: str = "float64"  # float type of audio, spectrograms and dictionaries (nmf)
+    audio: InputAudio = None  # input_path already decoded, backends decode it once otherwise
 
     @staticmethod
     def should_reverse(reverse: bool, extraction_type: ExtractionType) -> bool:
@@ -55,11 +71,24 @@ class SaveWavParams:
     sample_rate: int
     input_track: str
     output_path : Pathname = "result"
+    output_format: str = "wav"  # wav, flac or npy
     
 @dataclass
 class EvalParams:
     ref_path: Pathname
+    mode: str = "bss"  # bss (museval) or fast (framewise SI-SDR only)
     
 @dataclass
 class SaveEvalParams:
     output_path: Pathname = "eval"
+
+
+@dataclass
+class BatchParams:
+    method: str
+    extract_params: ExtractParams
+    output_path: Pathname = "result"
+    evaluate: bool = False
+    workers: int = 1
+    output_format: str = "wav"
+    eval_mode: str = "bss"
@@ -1,14 +1,104 @@
-import museval    
+import os
+from concurrent.futures import Future, ProcessPoolExecutor
+
+import numpy as np
 import soundfile as sf
 
-from sss.dataclasses import EvalParams, AudioWave
+from sss.dataclasses import EvalParams, AudioWave, Instrument
+
+# framing of museval.evaluate: one-second windows at 44.1 kHz, without overlap
+WINDOW = 44100
+HOP = 44100
 
 
 def evaluate_results(result_wave: AudioWave, eval_params: EvalParams) -> tuple:
-    def evaluate_single(reference):
-        results = museval.evaluate([reference], [result_wave])
-        return tuple([res.flatten() for res in results])
-    
     print(f"Starting result evaluation...")
     reference, _ = sf.read(eval_params.ref_path)
-    return evaluate_single(reference)
\ No newline at end of file
+    return evaluate_single(reference, result_wave, eval_params.mode)
+
+
+def evaluate_all_results(result_waves: list[AudioWave], eval_params: list[EvalParams], jobs: int = None) -> list[tuple]:
+    with ResultEvaluator(jobs) as evaluator:
+        for result_wave, params in zip(result_waves, eval_params):
+            evaluator.submit(result_wave, params)
+        return evaluator.results()
+
+
+class ResultEvaluator:
+    """
+    Evaluates results as they are submitted, while later ones are still being separated.
+    BSS-eval runs on up to `jobs` processes, one per instrument by default; fast evaluation runs inline,
+    as it takes less time than sending the waves to another process.
+    Each distinct reference file is read once per set of results gathered by `results`.
+    """
+    def __init__(self, jobs: int = None):
+        self.jobs = jobs or min(os.cpu_count(), len(Instrument))
+        self.pool = None
+        self.references = {}
+        self.pending: list[Future] = []
+
+    def __enter__(self) -> "ResultEvaluator":
+        return self
+
+    def __exit__(self, *_exc):
+        if self.pool is not None:
+            self.pool.shutdown()
+
+    def submit(self, result_wave: AudioWave, eval_params: EvalParams):
+        if eval_params.ref_path not in self.references:
+            self.references[eval_params.ref_path], _ = sf.read(eval_params.ref_path)
+        evaluation = (self.references[eval_params.ref_path], result_wave, eval_params.mode)
+        if self.jobs < 2 or eval_params.mode == "fast":
+            self.pending.append(Future())
+            self.pending[-1].set_result(evaluate_single(*evaluation))
+            return
+        if self.pool is None:
+            self.pool = ProcessPoolExecutor(max_workers=self.jobs)
+        self.pending.append(self.pool.submit(evaluate_single, *evaluation))
+
+    def results(self) -> list[tuple]:
+        """Waits for the results in submission order and starts a new set."""
+        if self.pending:
+            print(f"Gathering evaluation of {len(self.pending)} results...")
+        pending, self.pending, self.references = self.pending, [], {}
+        return [future.result() for future in pending]
+
+
+def evaluate_single(reference: AudioWave, result_wave: AudioWave, mode: str = "bss") -> tuple:
+    if mode == "fast":
+        return evaluate_fast(reference, result_wave)
+
+    import museval
+    results = museval.evaluate([reference], [result_wave], win=WINDOW, hop=HOP)
+    return tuple([res.flatten() for res in results])
+
+
+def evaluate_fast(reference: AudioWave, result_wave: AudioWave) -> tuple:
+    """
+    Framewise scale-invariant SDR (also known as SI-SNR) over the windows museval uses, in place of BSS-eval's SDR.
+    SIR, SAR and ISR cannot be computed without the other sources and are NaN.
+    Like museval, the result is zero-padded or truncated to the reference length, silent reference windows score NaN.
+    Silent estimate windows of a non-silent reference score -inf, so an estimate collapsing to silence is not missed.
+    """
+    reference = reference.reshape(len(reference), -1)
+    estimate = result_wave.reshape(len(result_wave), -1)[:len(reference)]
+    estimate = np.pad(estimate, ((0, len(reference) - len(estimate)), (0, 0)))
+
+    window = min(WINDOW, len(reference))
+    # (windows, channels, samples) views, both channels of a window are scored together
+    reference_frames = np.lib.stride_tricks.sliding_window_view(reference, window, axis=0)[::HOP]
+    estimate_frames = np.lib.stride_tricks.sliding_window_view(estimate, window, axis=0)[::HOP]
+    cross = np.einsum("wcn,wcn->w", reference_frames, estimate_frames)
+    reference_energy = np.einsum("wcn,wcn->w", reference_frames, reference_frames)
+    estimate_energy = np.einsum("wcn,wcn->w", estimate_frames, estimate_frames)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        # energies of the scaled reference and of the rest of the estimate
+        target_energy = cross ** 2 / reference_energy
+        noise_energy = np.maximum(estimate_energy - target_energy, 0)
+        si_sdr = 10 * np.log10(target_energy / noise_energy)
+    si_sdr[estimate_energy == 0] = -np.inf
+    si_sdr[reference_energy == 0] = np.nan
+
+    unavailable = np.full_like(si_sdr, np.nan)
+    return si_sdr, unavailable, unavailable.copy(), unavailable.copy()
@@ -1,12 +1,34 @@
 from __future__ import annotations
 
 import os
-import shutil
+import random
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import ExitStack
+from functools import lru_cache
+from itertools import repeat
+from multiprocessing.shared_memory import SharedMemory
 from pathlib import Path
 
+import numpy as np
 import soundfile as sf
+import torch as th
+from demucs.apply import apply_model
+from demucs.audio import convert_audio
+from demucs.pretrained import get_model
+
+from sss.dataclasses import ExtractParams, SaveWavParams, ResultWaves, AudioWave, Instrument, Pathname
+from sss.models import DEMUCS_MODEL_NAME as MODEL_NAME
+from sss.persistance import open_result_file, result_path, read_input
+from sss.streaming import stream_separation
+
+QUALITY_TO_SHIFTS = {"fast": 1, "normal": 10, "high": 20}
+# streamed windows last DEFAULT_SEGMENT seconds unless set, neighbours cross-fade over SEGMENT_OVERLAP of a window
+DEFAULT_SEGMENT = 30.0
+SEGMENT_OVERLAP = 0.1
+# keeps the normalization of silent windows finite
+EPS = 1e-8
 
-from sss.dataclasses import ExtractParams, ResultWaves, Instrument
 
 class DemucsCommandBuilder:
     def __init__(self):
@@ -28,9 +50,11 @@ class DemucsCommandBuilder:
             else ""
         return self.add_command_part(cmd_part)
     
+    def add_output_part(self, output_root: str) -> DemucsCommandBuilder:
+        return self.add_command_part(f'-o "{output_root}"')
+    
     def add_quality_part(self, quality: str) -> DemucsCommandBuilder:
-        quality_to_shifts = {"fast": 1, "normal": 10, "high": 20}
-        cmd_part = f"--shifts {quality_to_shifts[quality]}"
+        cmd_part = f"--shifts {QUALITY_TO_SHIFTS[quality]}"
         return self.add_command_part(cmd_part)
 
     @staticmethod
@@ -41,11 +65,130 @@ class DemucsCommandBuilder:
         return f"Demucs builder with command: {self.construct_command()}"
 
 
+def default_device() -> str:
+    # picked like the demucs command line does
+    return "cuda" if th.cuda.is_available() else "cpu"
+
+
+@lru_cache(maxsize=None)
+def load_model(name: str = MODEL_NAME, device: str = None):
+    model = get_model(name)
+    model.to(device or default_device())
+    model.eval()
+    return model
+
+
+def init_shift_worker(n_threads: int):
+    th.set_num_threads(n_threads)
+    load_model(device="cpu")
+
+
+def apply_shift_group(mix_name: str, shape: tuple[int, ...], seeds: list[int]) -> np.ndarray:
+    """Sums the passes of a group of random shifts over the mix the parent shares, instead of returning every pass."""
+    def apply_single_shift(seed: int) -> th.Tensor:
+        random.seed(seed)
+        return apply_model(load_model(device="cpu"), wav[None], shifts=1, split=True, overlap=0.25)[0]
+
+    mix = SharedMemory(name=mix_name)
+    try:
+        wav = th.from_numpy(np.ndarray(shape, dtype=np.float32, buffer=mix.buf).copy())
+    finally:
+        mix.close()
+    return sum(apply_single_shift(seed) for seed in seeds).numpy()
+
+
+@lru_cache(maxsize=None)
+def shift_pool(jobs: int) -> ProcessPoolExecutor:
+    # kept for the whole process, so the workers load the model only once
+    return ProcessPoolExecutor(max_workers=jobs, initializer=init_shift_worker,
+                               initargs=(max(1, os.cpu_count() // jobs),))
+
+
+def apply_shifts(model, wav: th.Tensor, shifts: int, jobs: int) -> th.Tensor:
+    # a GPU runs the shifts faster one after another than CPU workers do in parallel
+    if jobs < 2 or shifts < 2 or wav.device.type != "cpu":
+        return apply_model(model, wav[None], shifts=shifts, split=True, overlap=0.25)[0]
+    # every random shift is an independent pass, averaged just like demucs does serially;
+    # the mix is shared once and every worker sends back a single sum, whatever the number of shifts
+    seeds = [random.randrange(2 ** 32) for _ in range(shifts)]
+    mix = SharedMemory(create=True, size=wav.numel() * np.dtype(np.float32).itemsize)
+    try:
+        np.ndarray(wav.shape, dtype=np.float32, buffer=mix.buf)[:] = wav.numpy()
+        seed_groups = [seeds[index::jobs] for index in range(min(jobs, shifts))]
+        partial_sums = shift_pool(jobs).map(apply_shift_group, repeat(mix.name), repeat(tuple(wav.shape)), seed_groups)
+        return th.from_numpy(sum(partial_sums) / shifts)
+    finally:
+        mix.close()
+        mix.unlink()
+
+
+def separate(model, wav: th.Tensor, params: ExtractParams) -> list[th.Tensor]:
+    def compute_reversed_source(sources: dict[str, th.Tensor]) -> th.Tensor:
+        if not DemucsCommandBuilder.should_be_two_stems(params.instruments):
+            return sources[Instrument.other.value]
+        return sum(source for name, source in sources.items() if name != params.instruments[0].value)
+
+    ref = wav.mean(0)
+    ref_mean, ref_std = ref.mean(), ref.std() + EPS
+    wav = ((wav - ref_mean) / ref_std).to(default_device())
+    separated = apply_shifts(model, wav, QUALITY_TO_SHIFTS[params.quality], params.jobs).cpu()
+    sources = dict(zip(model.sources, separated * ref_std + ref_mean))
+    results = [sources[instr.value] for instr in params.instruments]
+    if params.reverse:
+        results.append(compute_reversed_source(sources))
+    return results
+
+
+def to_input_format(result: th.Tensor, model, sample_rate: int, channels: int, length: int) -> AudioWave:
+    """Converts a separated source back to the input's sample rate, channels and length, shaped (frames, channels)."""
+    wave = convert_audio(result, model.samplerate, sample_rate, channels).numpy().T
+    return wave[:length] if len(wave) >= length else np.pad(wave, ((0, length - len(wave)), (0, 0)))
+
+
+def result_instruments(params: ExtractParams) -> list[Instrument]:
+    return params.instruments + ([Instrument.other] if params.reverse else [])
+
+
+def preload(_params: ExtractParams):
+    load_model()
+
+
 def perform_demucs(params: ExtractParams) -> ResultWaves:
-    def build_from_extract_params(params: ExtractParams) -> str:
+    model = load_model()
+    audio = read_input(params)
+    wav = convert_audio(th.from_numpy(audio.samples.T.astype(np.float32)), audio.sample_rate,
+                        model.samplerate, model.audio_channels)
+    results = separate(model, wav, params)
+    channels, length = audio.samples.shape[1], len(audio.samples)
+    return [(instr, to_input_format(result, model, audio.sample_rate, channels, length))
+            for instr, result in zip(result_instruments(params), results)]
+
+
+def stream_demucs(params: ExtractParams, save_params: SaveWavParams) -> list[tuple[Instrument, Pathname]]:
+    def separate_block(block: AudioWave) -> list[AudioWave]:
+        wav = th.from_numpy(np.ascontiguousarray(block.T, dtype=np.float32))
+        wav = convert_audio(wav, info.samplerate, model.samplerate, model.audio_channels)
+        return [to_input_format(result, model, info.samplerate, info.channels, len(block))
+                for result in separate(model, wav, params)]
+
+    model = load_model()
+    info = sf.info(params.input_path)
+    window = int((params.segment or DEFAULT_SEGMENT) * info.samplerate)
+    overlap = int(window * SEGMENT_OVERLAP)
+    instruments = result_instruments(params)
+    with ExitStack() as stack:
+        outputs = [stack.enter_context(open_result_file(instrument, save_params, info.channels, info.frames))
+                   for instrument in instruments]
+        stream_separation(params.input_path, separate_block, outputs, block_size=window - overlap, overlap=overlap)
+    return [(instrument, result_path(instrument, save_params)) for instrument in instruments]
+
+
+def perform_demucs_cli(params: ExtractParams) -> ResultWaves:
+    def build_from_extract_params(params: ExtractParams, output_root: str) -> str:
         return DemucsCommandBuilder()\
             .add_instrument_part(params.instruments)\
             .add_quality_part(params.quality)\
+            .add_output_part(output_root)\
             .add_input_part(params.input_path)\
             .construct_command()
 
@@ -56,12 +199,12 @@ def perform_demucs(params: ExtractParams) -> ResultWaves:
             raise Exception(f"Demucs did not exec successfully. Error {demucs_exec_res}")
 
 
-    def potential_directory():
+    def potential_directory(output_root: str):
         input_filename = Path(params.input_path).stem
-        return os.path.join("separated", "mdx_extra_q", input_filename)
+        return os.path.join(output_root, MODEL_NAME, input_filename)
 
     
-    def find_output_files(params: ExtractParams) -> dict:
+    def find_output_files(params: ExtractParams, output_root: str) -> dict:
         def include_other(directory, paths):
             path_to_other = f"no_{params.instruments[0].value}.wav"\
                 if DemucsCommandBuilder.should_be_two_stems(params.instruments)\
@@ -73,7 +216,7 @@ def perform_demucs(params: ExtractParams) -> ResultWaves:
             {instrument: os.path.join(directory, f"{instrument.value}.wav")
                 for instrument in params.instruments}
 
-        directory = potential_directory()
+        directory = potential_directory(output_root)
         if not os.path.exists(directory):
             raise Exception("Can't find demucs extraction folder")
         paths = get_paths_dict(directory)
@@ -81,11 +224,12 @@ def perform_demucs(params: ExtractParams) -> ResultWaves:
             paths = include_other(directory, paths)
         return paths
     
-    command = build_from_extract_params(params)
-    run_demucs(command)
-    
-    result_paths = find_output_files(params)
-    result_waves = [(instr, sf.read(result_path)[0]) for instr, result_path in result_paths.items()]
-    shutil.rmtree(potential_directory())
+    # every call separates into its own output root, so concurrent jobs never share files
+    with tempfile.TemporaryDirectory(prefix="sss-demucs-") as output_root:
+        command = build_from_extract_params(params, output_root)
+        run_demucs(command)
+        
+        result_paths = find_output_files(params, output_root)
+        result_waves = [(instr, sf.read(result_path)[0]) for instr, result_path in result_paths.items()]
 
     return result_waves
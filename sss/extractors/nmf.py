@@ -1,93 +1,247 @@
+from __future__ import annotations
+
+import hashlib
 import os
-import warnings
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import ExitStack
+from dataclasses import dataclass, field
+from itertools import repeat
 from pathlib import Path
+from typing import Iterator
 
 import soundfile as sf
 import librosa    
 
 import numpy as np
+from threadpoolctl import threadpool_limits
+
+from sss.dataclasses import ResultWaves, ExtractParams, SaveWavParams, AudioWave, Spectrogram, Instrument, Pathname
+from sss.models import load_dictionary, stacked_dictionary, model_version
+from sss.persistance import open_result_file, result_path, save_activations, load_activations, read_input
+from sss.streaming import stream_separation
+
+EPS = np.finfo(np.float32).eps
+CONVERGENCE_CHECK_EVERY = 10
+N_FFT = 2048
+HOP_LENGTH = 512
+# unless a segment length is set, streaming blocks span STREAM_BLOCK_FRAMES STFT frames,
+# cross-faded over STREAM_OVERLAP samples
+STREAM_BLOCK_FRAMES = 1024
+STREAM_OVERLAP = 4 * N_FFT
+
+_blas_limits = None
+
+
+def fixed_dictionary_nmf(V: Spectrogram, W: np.ndarray, max_iter: int, tol: float = 0,
+                         H_init: np.ndarray = None) -> tuple[np.ndarray, int]:
+    """
+    Supervised KL-NMF: only the activations H are updated, W stays fixed.
+    V may carry leading batch axes, e.g. (channels, freq, frames).
+    Refines `H_init` when given. Stops early once the relative KL divergence
+    decrease drops below `tol`; returns the activations and the number of
+    iterations actually run.
+    """
+    def kl_divergence(WH):
+        return np.sum(V * np.log((V + EPS) / WH) - V + WH)
+
+    W_col_sums = W.sum(axis=0)[:, np.newaxis] + EPS
+    tiny = np.finfo(V.dtype).tiny
+    H = initial_activations(V, W) if H_init is None else H_init.copy()
+    initial_loss = previous_loss = None
+    for n_iter in range(1, max_iter + 1):
+        WH = W @ H + EPS
+        if tol > 0 and (n_iter - 1) % CONVERGENCE_CHECK_EVERY == 0:
+            loss = kl_divergence(WH)
+            if initial_loss is None:
+                initial_loss = loss
+            elif (previous_loss - loss) / initial_loss < tol:
+                return H, n_iter - 1
+            previous_loss = loss
+        H *= (W.T @ (V / WH)) / W_col_sums
+        # vanishing activations would turn subnormal, which is very slow in float32 arithmetic
+        H[H < tiny] = 0
+    return H, max_iter
+
+
+def initial_activations(V: Spectrogram, W: np.ndarray, H_previous: np.ndarray = None) -> np.ndarray:
+    """
+    Without `H_previous` every frame starts from flat activations that reproduce its total energy.
+    Activations of the same spectrogram are reused as they are; those of a different segment
+    contribute their mean activation profile, rescaled to the energy of each frame.
+    """
+    H_shape = V.shape[:-2] + (W.shape[1], V.shape[-1])
+    if H_previous is not None and H_previous.shape == H_shape:
+        return np.maximum(H_previous.astype(V.dtype, copy=False), EPS)
+    profile = np.ones(H_shape[:-1] + (1,), dtype=V.dtype) if H_previous is None \
+        else H_previous.mean(axis=-1, keepdims=True, dtype=V.dtype)
+    frame_energy = V.sum(axis=-2, keepdims=True) / ((W @ profile).sum(axis=-2, keepdims=True) + EPS)
+    return profile * frame_energy + EPS
+
+
+@dataclass
+class SpectrogramCache:
+    """Spectrograms computed once per extraction, shaped (channels, freq, frames); `stems` holds one per instrument."""
+    mixture: np.ndarray
+    magnitude: Spectrogram = field(init=False)
+    stems: list[Spectrogram] = field(default_factory=list)
+
+    def __post_init__(self):
+        self.magnitude = np.ascontiguousarray(np.abs(self.mixture))
+
+
+class NMFSeparator:
+    def __init__(self, params: ExtractParams):
+        # instruments whose stacked dictionaries are solved together, one solve per entry
+        self.dictionary_sets = [tuple(params.instruments)] if params.joint \
+            else [(instrument,) for instrument in params.instruments]
+        self.instruments = params.instruments + ([Instrument.other] if params.reverse else [])
+        self.max_iter = compute_max_iter(params)
+        self.tol = compute_tol(params)
+        self.reverse = params.reverse
+        self.iterations = []
+        # activations of the latest separation and the ones to refine instead of a fresh start,
+        # in solve order; previous_iterations counts iterations already spent on the latter
+        self.activations = []
+        self.warm_start = []
+        self.previous_iterations = []
+        self.chain_segments = False
+        self.jobs = params.jobs
+        self.dtype = params.precision
+        self.pool = ProcessPoolExecutor(max_workers=self.jobs, initializer=limit_blas_threads,
+                                        initargs=(max(1, os.cpu_count() // self.jobs),)) if self.jobs > 1 else None
+
+    def __enter__(self) -> NMFSeparator:
+        return self
+
+    def __exit__(self, *_exc):
+        if self.pool is not None:
+            self.pool.shutdown()
+
+    def separate(self, input_wave: AudioWave) -> list[AudioWave]:
+        return list(self.iter_separate(input_wave))
+
+    def iter_separate(self, input_wave: AudioWave) -> Iterator[AudioWave]:
+        """Yields the audiowaves in `instruments` order, each as soon as its dictionary set is solved."""
+        self.activations = []
+        cache = SpectrogramCache(mixture=get_stft_from_wave(input_wave))
+        for instruments in self.dictionary_sets:
+            for stem in self.compute_result_spectrograms(cache, instruments):
+                cache.stems.append(stem)
+                yield get_wave_from_spectrogram(stem, len(input_wave))
+        if self.chain_segments:
+            self.warm_start, self.previous_iterations = self.activations, []
+        if self.reverse:
+            yield get_wave_from_spectrogram(self.compute_reversed_spectrogram(cache), len(input_wave))
+
+    def report(self):
+        for n_iter in self.iterations:
+            print(f"NMF stopped after {n_iter} of {self.max_iter} iterations")
+
+    def solve(self, V: Spectrogram, instruments: tuple[Instrument, ...]) -> np.ndarray:
+        W = stacked_dictionary(instruments, self.dtype)
+        solve_index = len(self.activations)
+        H_previous = self.warm_start[solve_index] if solve_index < len(self.warm_start) else None
+        done_iter = self.previous_iterations[solve_index] if solve_index < len(self.previous_iterations) else 0
+        H_init = initial_activations(V, W, H_previous)
+        max_iter = max(self.max_iter - done_iter, 0)
+        if self.pool is None:
+            H, n_iter = fixed_dictionary_nmf(V, W, max_iter, self.tol, H_init)
+        else:
+            # with W fixed every frame's activations are independent, so segments need no overlap
+            segments = np.array_split(V, self.jobs, axis=-1)
+            H_init_segments = np.array_split(H_init, self.jobs, axis=-1)
+            results = list(self.pool.map(solve_segment, segments, repeat(instruments),
+                                         repeat(max_iter), repeat(self.tol), H_init_segments, repeat(self.dtype)))
+            H = np.concatenate([H_segment for H_segment, _ in results], axis=-1)
+            n_iter = max(n_iter for _, n_iter in results)
+        self.activations.append(H)
+        self.iterations.append(done_iter + n_iter)
+        return H
+
+    def compute_result_spectrograms(self, cache: SpectrogramCache, instruments: tuple[Instrument, ...]) -> list[Spectrogram]:
+        H = self.solve(cache.magnitude, instruments)
+        wage_matrices = [load_dictionary(instrument, self.dtype) for instrument in instruments]
+        H_blocks = np.split(H, np.cumsum([W.shape[1] for W in wage_matrices])[:-1], axis=-2)
+        return [W_train @ H_block for W_train, H_block in zip(wage_matrices, H_blocks)]
 
-from sklearn.decomposition import NMF
-from sklearn.exceptions import ConvergenceWarning
+    @staticmethod
+    def compute_reversed_spectrogram(cache: SpectrogramCache) -> np.ndarray:
+        cum_instr_spectrogram = np.sum(cache.stems, axis=0)
+        residual_spectrogram = np.maximum(cache.magnitude - cum_instr_spectrogram, 0)
+        return cache.mixture * (residual_spectrogram / (cache.magnitude + EPS))
+
+
+def limit_blas_threads(n_threads: int):
+    global _blas_limits
+    _blas_limits = threadpool_limits(limits=n_threads)
+
+
+def solve_segment(V: Spectrogram, instruments: tuple[Instrument, ...], max_iter: int, tol: float,
+                  H_init: np.ndarray, dtype: str) -> tuple[np.ndarray, int]:
+    # workers look the dictionaries up in their own registry instead of receiving a pickled copy
+    return fixed_dictionary_nmf(V, stacked_dictionary(instruments, dtype), max_iter, tol, H_init)
+
+
+def compute_max_iter(params: ExtractParams) -> int:
+    quality_to_max_iter = {"fast": 20, "normal": 200, "high": 1000}
+    return params.max_iter if params.max_iter else quality_to_max_iter[params.quality]
+
+
+def compute_tol(params: ExtractParams) -> float:
+    quality_to_tol = {"fast": 1e-3, "normal": 1e-4, "high": 1e-5}
+    return params.tol if params.tol is not None else quality_to_tol[params.quality]
+
+
+def activations_path(params: ExtractParams) -> Pathname:
+    """Activations are only refined by runs on the same input with the same dictionaries and precision."""
+    input_path = Path(params.input_path).resolve()
+    input_stat = input_path.stat()
+    run_key = f"{input_path}|{input_stat.st_size}|{input_stat.st_mtime_ns}|" \
+              f"{[instr.value for instr in params.instruments]}|{params.joint}|" \
+              f"{model_version('nmf', params.instruments)}|{params.precision}"
+    digest = hashlib.sha1(run_key.encode()).hexdigest()[:16]
+    return os.path.join(params.activations_dir, f"{input_path.stem}-{digest}.npz")
+
+
+def get_stft_from_wave(wave: AudioWave) -> np.ndarray:
+    return librosa.stft(y=np.ascontiguousarray(wave.T), n_fft=N_FFT, hop_length=HOP_LENGTH)
+
+
+def get_wave_from_spectrogram(spectrogram: np.ndarray, length: int) -> AudioWave:
+    return librosa.istft(stft_matrix=spectrogram, n_fft=N_FFT, hop_length=HOP_LENGTH, length=length).T
+
+
+def preload(params: ExtractParams):
+    for instrument in params.instruments:
+        load_dictionary(instrument, params.precision)
 
-from sss.dataclasses import ResultWaves, ExtractParams, AudioWave, MonoWave, Spectrogram, Instrument
 
 def perform_nmf(params: ExtractParams) -> ResultWaves:
-    RANK = 96    
-    warnings.filterwarnings(action="ignore", category=ConvergenceWarning)
-    
-    def load_train_matrix(instrument: Instrument) -> Spectrogram:
-        base_dir = Path("train/wage_matrices")
-        w_rel_path = f"{instrument.value}.npy"
-        w_path = os.path.join(base_dir, w_rel_path)
-        return np.load(w_path)
-    
-    def compute_max_iter(params: ExtractParams):
-        quality_to_max_iter = {"fast": 20, "normal": 200, "high": 1000}
-        return params.max_iter if params.max_iter else quality_to_max_iter[params.quality]
-    
-    def nmf(V, max_iter):
-        model = NMF(n_components=RANK,
-            solver="mu",
-            max_iter=max_iter,
-            beta_loss="kullback-leibler")
-        W = model.fit_transform(V)
-        H = model.components_
-        return W, H
-    
-    def left_channel(wave: AudioWave) -> MonoWave:
-        return wave[:, 0]
-    
-    def right_channel(wave: AudioWave) -> MonoWave:
-        return wave[:, 1]
-    
-    def combine_monowaves(left: MonoWave, right: MonoWave) -> AudioWave:
-        return np.vstack([left, right]).T 
-    
-    def get_spectrogram_from_mono_wave(wave: MonoWave) -> Spectrogram:
-        return np.abs(librosa.stft(y=wave, n_fft=2048, hop_length=512))
-    
-    def get_mono_wave_from_spectrogram(spectrogram: Spectrogram) -> MonoWave:
-        return librosa.istft(stft_matrix=spectrogram, n_fft=2048, hop_length=512)     
-    
-    def compute_one_channel(input_wave, W_train, max_iter):
-        spectrogram = get_spectrogram_from_mono_wave(input_wave)
-        _, H = nmf(spectrogram, max_iter)
-        output_spectrogram = W_train @ H
-        return get_mono_wave_from_spectrogram(output_spectrogram)
-    
-    def compute_result_wave(input_wave: AudioWave, W_train: np.ndarray, max_iter: int) -> AudioWave:
-        left_output_audio = \
-            compute_one_channel(left_channel(input_wave), W_train, max_iter)
-        right_output_audio = \
-            compute_one_channel(right_channel(input_wave), W_train, max_iter)
-            
-        return combine_monowaves(left_output_audio, right_output_audio)
-    
-    
-    def compute_reversed_monowave(wave: MonoWave, separated_instrument_waves: list[MonoWave]) -> MonoWave:
-        input_spectrogram = get_spectrogram_from_mono_wave(wave)
-        instrument_spectrograms = np.array([get_spectrogram_from_mono_wave(wave) for wave in separated_instrument_waves])
-        cum_instr_spectrogram = np.sum(instrument_spectrograms, axis=0)
-        reversed_spectrogram = np.abs(input_spectrogram - cum_instr_spectrogram)
-        
-        return get_mono_wave_from_spectrogram(reversed_spectrogram)
-    
-    def compute_reversed_wave(input_wave: AudioWave, separated_instrument_waves: list[AudioWave]) -> AudioWave:
-        left_waves, right_waves = [left_channel(wave) for wave in separated_instrument_waves], [right_channel(wave) for wave in separated_instrument_waves]
-        left = compute_reversed_monowave(left_channel(input_wave), left_waves)        
-        right = compute_reversed_monowave(right_channel(input_wave), right_waves)
-        
-        return combine_monowaves(left, right)
-    
-    
-    input_wave, _ = sf.read(params.input_path)
-    wage_matrices = [load_train_matrix(instr) for instr in params.instruments]
-    
-    max_iter = compute_max_iter(params)
-    separated_instrument_waves = [compute_result_wave(input_wave, W_t, max_iter) for W_t in wage_matrices]
-    if params.reverse:
-        reversed_wave = compute_reversed_wave(input_wave, separated_instrument_waves)
-        params.instruments.append(Instrument.other)
-        separated_instrument_waves.append(reversed_wave)
-    return list(zip(params.instruments, separated_instrument_waves))
+    return list(iter_nmf(params))
+
+
+def iter_nmf(params: ExtractParams) -> Iterator[tuple[Instrument, AudioWave]]:
+    input_wave = read_input(params).samples
+    with NMFSeparator(params) as separator:
+        if params.activations_dir and os.path.exists(activations_path(params)):
+            separator.warm_start, separator.previous_iterations = load_activations(activations_path(params))
+        yield from zip(separator.instruments, separator.iter_separate(input_wave))
+        if params.activations_dir:
+            save_activations(separator.activations, separator.iterations, activations_path(params))
+    separator.report()
+
+
+def stream_nmf(params: ExtractParams, save_params: SaveWavParams) -> list[tuple[Instrument, Pathname]]:
+    info = sf.info(params.input_path)
+    with ExitStack() as stack:
+        separator = stack.enter_context(NMFSeparator(params))
+        separator.chain_segments = True
+        outputs = [stack.enter_context(open_result_file(instrument, save_params, info.channels, info.frames))
+                   for instrument in separator.instruments]
+        block_size = int(params.segment * info.samplerate) if params.segment \
+            else STREAM_BLOCK_FRAMES * HOP_LENGTH
+        stream_separation(params.input_path, separator.separate, outputs, block_size=block_size, overlap=STREAM_OVERLAP,
+                          dtype=params.precision)
+    print(f"NMF processed {len(separator.iterations)} decompositions, "
+          f"{np.mean(separator.iterations):.0f} of {separator.max_iter} iterations on average")
+    return [(instrument, result_path(instrument, save_params)) for instrument in separator.instruments]
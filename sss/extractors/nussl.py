@@ -1,24 +1,44 @@
 import nussl
 import numpy as np
+from sklearn.decomposition import non_negative_factorization
 
 from sss.dataclasses import ExtractParams, ResultWaves, Instrument, AudioWave
-from pathlib import Path
-import pickle
+from sss.models import NusslModel, load_nussl_model
+from sss.persistance import read_input
 
 from functools import reduce
+from typing import Iterator
+
+
+def preload(params: ExtractParams):
+    for instrument in params.instruments:
+        load_nussl_model(instrument)
 
 
 def perform_nussl(extract_params: ExtractParams) -> ResultWaves:
-    def load_model(instrument: Instrument):
-        folder = Path("train/nmf_models")
-        model_path = folder / f"{instrument.value}.pk1"
-        with open(model_path, 'rb') as file:
-            NMF, _, _ = pickle.load(file)
-            return NMF
+    return list(iter_nussl(extract_params))
+
+
+def iter_nussl(extract_params: ExtractParams) -> Iterator[tuple[Instrument, AudioWave]]:
+    def stft_params(model: NusslModel) -> nussl.STFTParams:
+        return nussl.STFTParams(window_length=model.metadata["n_fft"],
+                                hop_length=model.metadata["hop_length"],
+                                window_type=model.metadata["window_type"])
+
+    def transform(sig: nussl.AudioSignal, model: NusslModel):
+        # same data layout as nussl.separation.NMFMixin.transform, with the stored components kept fixed
+        data = np.abs(sig.stft())
+        shape = data.shape
+        data = data.transpose().reshape(-1, shape[0])
+        activations, _, _ = non_negative_factorization(data, H=model.components.astype(data.dtype),
+                                                       n_components=model.metadata["rank"], init=None,
+                                                       update_H=False, **model.metadata["solver"])
+        return model.components, activations.T.reshape((model.metadata["rank"],) + shape[1:])
     
-    def compute_audio_wave(W, H) -> AudioWave:
+    def compute_audio_wave(W, H, model: NusslModel) -> AudioWave:
         reconstructed_spectrogram = nussl.separation.NMFMixin.inverse_transform(W, H)
-        return nussl.AudioSignal(stft=reconstructed_spectrogram).istft().T
+        return nussl.AudioSignal(stft=reconstructed_spectrogram, sample_rate=model.metadata["sample_rate"],
+                                 stft_params=stft_params(model)).istft().T
     
     def results_to_signals(results: ResultWaves, duration: float) -> list[nussl.AudioSignal]:
         return [nussl.AudioSignal(audio_data_array=wave).truncate_seconds(duration).peak_normalize() for _instr, wave in results]
@@ -28,10 +48,14 @@ def perform_nussl(extract_params: ExtractParams) -> ResultWaves:
         subtraction = reduce(lambda as1, as2: as1 - as2, result_signals, original)
         return subtraction.audio_data.T
     
-    sig = nussl.AudioSignal(extract_params.input_path)
-    models = [load_model(instr) for instr in extract_params.instruments]
-    matrices = [nussl.separation.NMFMixin.transform(sig, model) for model in models]
-    results = [ (instr, compute_audio_wave(W, H)) for instr, (W, H) in zip(extract_params.instruments, matrices)]
+    audio = read_input(extract_params)
+    sig = nussl.AudioSignal(audio_data_array=audio.samples.T, sample_rate=audio.sample_rate)
+    models = [load_nussl_model(instr) for instr in extract_params.instruments]
+    sig.stft_params = stft_params(models[0])
+    results = []
+    for instr, model in zip(extract_params.instruments, models):
+        W, H = transform(sig, model)
+        results.append((instr, compute_audio_wave(W, H, model)))
+        yield results[-1]
     if extract_params.reverse:
-        results.append((Instrument("other"), compute_reversed_wave(sig, results_to_signals(results, sig.signal_duration))))
-    return results
+        yield Instrument("other"), compute_reversed_wave(sig, results_to_signals(results, sig.signal_duration))
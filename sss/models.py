@@ -0,0 +1,87 @@
+import json
+import os
+from dataclasses import dataclass
+from functools import lru_cache
+from pathlib import Path
+
+import numpy as np
+
+from sss.dataclasses import Instrument
+
+# resolved once, so separation works from any working directory; SSS_MODELS_DIR points to another model store
+MODELS_DIR = Path(os.environ.get("SSS_MODELS_DIR", Path(__file__).resolve().parent.parent / "train")).resolve()
+NUSSL_MODEL_VERSION = 1
+DEMUCS_MODEL_NAME = "mdx_extra_q"
+
+
+@dataclass(frozen=True)
+class NusslModel:
+    components: np.ndarray
+    metadata: dict
+
+
+def dictionary_path(instrument: Instrument) -> Path:
+    return MODELS_DIR / "wage_matrices" / f"{instrument.value}.npy"
+
+
+@lru_cache(maxsize=16)
+def load_dictionary(instrument: Instrument, dtype: str = "float64") -> np.ndarray:
+    """
+    Memory-mapped read-only NMF dictionary, so processes loading the same file share its pages.
+    Other precisions are converted once and cached alongside.
+    """
+    dictionary = np.load(dictionary_path(instrument), mmap_mode="r")
+    if dictionary.dtype == dtype:
+        return dictionary
+    converted = dictionary.astype(dtype)
+    converted.flags.writeable = False
+    return converted
+
+
+@lru_cache(maxsize=16)
+def stacked_dictionary(instruments: tuple[Instrument, ...], dtype: str = "float64") -> np.ndarray:
+    if len(instruments) == 1:
+        return load_dictionary(instruments[0], dtype)
+    return np.hstack([load_dictionary(instrument, dtype) for instrument in instruments])
+
+
+def nussl_model_path(instrument: Instrument) -> Path:
+    return MODELS_DIR / "nmf_models" / f"{instrument.value}.npy"
+
+
+def save_nussl_model(components: np.ndarray, metadata: dict, instrument: Instrument) -> Path:
+    path = nussl_model_path(instrument)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    np.save(path, np.ascontiguousarray(components))
+    with open(path.with_suffix(".json"), "w", encoding="UTF-8") as file:
+        json.dump({"format_version": NUSSL_MODEL_VERSION, "rank": components.shape[0], **metadata}, file, indent=4)
+    return path
+
+
+@lru_cache(maxsize=8)
+def load_nussl_model(instrument: Instrument) -> NusslModel:
+    path = nussl_model_path(instrument)
+    with open(path.with_suffix(".json"), encoding="UTF-8") as file:
+        metadata = json.load(file)
+    if metadata.get("format_version") != NUSSL_MODEL_VERSION:
+        raise ValueError(f"Nussl model {path} has format version {metadata.get('format_version')}, "
+                         f"expected {NUSSL_MODEL_VERSION}. Export it again with sss/preparation/nussl_prep.py")
+    components = np.load(path, mmap_mode="r")
+    if components.shape != (metadata["rank"], metadata["n_fft"] // 2 + 1):
+        raise ValueError(f"Nussl model {path} has components of shape {components.shape}, "
+                         f"which does not match its metadata")
+    return NusslModel(components, metadata)
+
+
+def model_version(method: str, instruments: list[Instrument]) -> str:
+    """Identifies the models a method separates with, so results computed with replaced models are told apart."""
+    def file_version(path: Path) -> str:
+        stat = path.stat()
+        return f"{path.name}:{stat.st_size}:{stat.st_mtime_ns}"
+
+    if method == "nmf":
+        return ",".join(file_version(dictionary_path(instrument)) for instrument in instruments)
+    if method == "nussl":
+        return f"v{NUSSL_MODEL_VERSION}," + ",".join(file_version(nussl_model_path(instrument))
+                                                      for instrument in instruments)
+    return DEMUCS_MODEL_NAME
@@ -1,27 +1,111 @@
 import os
 import json
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from dataclasses import replace
 from pathlib import Path
 
 import numpy as np
 import soundfile as sf
 
 
-from sss.dataclasses import SaveWavParams, SaveEvalParams, AudioWave, Pathname, Instrument
+from sss.dataclasses import SaveWavParams, SaveEvalParams, ExtractParams, InputAudio, AudioWave, Pathname, Instrument
+
+# soundfile format and subtype of each audio output format; npy stores raw float32 samples, shaped (frames, channels)
+AUDIO_OUTPUT_FORMATS = {"wav": ("WAV", "PCM_24"), "flac": ("FLAC", "PCM_24")}
+OUTPUT_FORMATS = [*AUDIO_OUTPUT_FORMATS, "npy"]
+
+
+def load_audio(path: Pathname, dtype: str = "float64") -> InputAudio:
+    with sf.SoundFile(path) as file:
+        return InputAudio(file.read(dtype=dtype, always_2d=True), file.samplerate)
+
+
+def read_input(params: ExtractParams) -> InputAudio:
+    """Decoded input of an extraction, decoding the file only if the caller has not done it already."""
+    if params.audio is None:
+        return load_audio(params.input_path, params.precision)
+    if params.audio.samples.dtype == params.precision:
+        return params.audio
+    return replace(params.audio, samples=params.audio.samples.astype(params.precision))
+
+
+def result_path(instrument: Instrument, save_params: SaveWavParams) -> Pathname:
+    return os.path.join(save_params.output_path, f"{save_params.input_track}-{instrument.value}")
+
+
+def result_file(path: Pathname, output_format: str) -> Pathname:
+    return f"{path}.{output_format}"
+
+
+def load_result(path: Pathname, output_format: str) -> AudioWave:
+    if output_format == "npy":
+        return np.load(result_file(path, output_format), mmap_mode="r")
+    return sf.read(result_file(path, output_format), always_2d=True)[0]
+
+
+class NpyResultFile:
+    """Incrementally written .npy result, with the write/close interface of sf.SoundFile."""
+    def __init__(self, file: Pathname, frames: int, channels: int):
+        self.samples = np.lib.format.open_memmap(file, mode="w+", dtype=np.float32, shape=(frames, channels))
+        self.position = 0
+
+    def __enter__(self) -> "NpyResultFile":
+        return self
+
+    def __exit__(self, *_exc):
+        self.close()
+
+    def write(self, wave: AudioWave):
+        wave = wave[:len(self.samples) - self.position]
+        self.samples[self.position:self.position + len(wave)] = wave
+        self.position += len(wave)
+
+    def close(self):
+        self.samples.flush()
+
+
+def open_result_file(instrument: Instrument, save_params: SaveWavParams, channels: int, frames: int):
+    path = result_file(result_path(instrument, save_params), save_params.output_format)
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    print(f"Streaming results to {path}")
+    if save_params.output_format == "npy":
+        return NpyResultFile(path, frames, channels)
+    file_format, subtype = AUDIO_OUTPUT_FORMATS[save_params.output_format]
+    return sf.SoundFile(path, 'w', save_params.sample_rate, channels, subtype, format=file_format)
 
 
 def save_results(result_wave: AudioWave, instrument: Instrument, save_params: SaveWavParams) -> Pathname:
-    def save_to_wmv(output_audio, path, sr):
-        Path(path).parent.mkdir(parents=True, exist_ok=True)
-        sf.write(path + '.wav', np.array(output_audio), sr, "PCM_24")
-        print(f"File saved to {path}.wav")
+    def write_stem(output_audio, path, sr, output_format):
+        file = result_file(path, output_format)
+        Path(file).parent.mkdir(parents=True, exist_ok=True)
+        if output_format == "npy":
+            np.save(file, output_audio.astype(np.float32, copy=False))
+        else:
+            file_format, subtype = AUDIO_OUTPUT_FORMATS[output_format]
+            sf.write(file, output_audio, sr, subtype, format=file_format)
+        print(f"File saved to {file}")
         return path
     
-    output_path = os.path.join(save_params.output_path, f"{save_params.input_track}-{instrument.value}")
-    saved_path = save_to_wmv(result_wave, output_path, save_params.sample_rate)
+    output_path = result_path(instrument, save_params)
+    saved_path = write_stem(result_wave, output_path, save_params.sample_rate, save_params.output_format)
 
     return saved_path
        
 
+def save_activations(activations: list[np.ndarray], iterations: list[int], path: Pathname) -> Pathname:
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    np.savez(path, *activations, iterations=np.array(iterations))
+    print(f"Activations saved to {path}")
+    return path
+
+
+def load_activations(path: Pathname) -> tuple[list[np.ndarray], list[int]]:
+    with np.load(path) as archive:
+        iterations = archive["iterations"].tolist()
+        return [archive[f"arr_{i}"] for i in range(len(iterations))], iterations
+
+
 def save_evaluation(eval_results, save_params: SaveEvalParams) -> Pathname:
     def get_unit_score(sdr, sir, sar, isr, second):
         metrics = {"SDR": sdr, "SIR": sir, "SAR": sar, "ISR": isr}
@@ -40,3 +124,46 @@ def save_evaluation(eval_results, save_params: SaveEvalParams) -> Pathname:
             in enumerate(zip(sdrs, sirs, sars, idrs))]
     eval_dict = {"targets": targets}
     return save_dict_as_json(eval_dict, save_params.output_path)
+
+
+class AsyncWriter:
+    """
+    Saves results and evaluations on background threads, so encoding and disk writes overlap with separation.
+    At most `max_pending` saves are queued; submitting more blocks until one of them is written,
+    which bounds the memory held by stems waiting for the disk.
+    """
+    def __init__(self, workers: int = 2, max_pending: int = 4):
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="sss-writer")
+        self.slots = threading.BoundedSemaphore(max_pending)
+        self.pending: list[Future] = []
+
+    def __enter__(self) -> "AsyncWriter":
+        return self
+
+    def __exit__(self, *_exc):
+        try:
+            self.flush()
+        finally:
+            self.executor.shutdown()
+
+    def save_results(self, result_wave: AudioWave, instrument: Instrument, save_params: SaveWavParams) -> Future:
+        return self.submit(save_results, result_wave, instrument, save_params)
+
+    def save_evaluation(self, eval_results, save_params: SaveEvalParams) -> Future:
+        return self.submit(save_evaluation, eval_results, save_params)
+
+    def submit(self, save, *args) -> Future:
+        self.slots.acquire()
+        future = self.executor.submit(save, *args)
+        future.add_done_callback(lambda _future: self.slots.release())
+        # finished saves are forgotten unless they failed, their errors are raised by the next flush
+        self.pending = [pending for pending in self.pending
+                        if not pending.done() or pending.exception() is not None] + [future]
+        return future
+
+    def flush(self):
+        """Waits until everything submitted so far is saved; raises the error of the first failed save."""
+        pending, self.pending = self.pending, []
+        wait(pending)
+        for future in pending:
+            future.result()
@@ -1,29 +1,54 @@
 #!/usr/bin/env python
+# run from the repository root: python -m sss.preparation.nussl_prep [--from-pickle]
 import nussl
 import os
+import sys
 import glob
 import pickle
 
 from pathlib import Path
 
+from sss.dataclasses import Instrument
+from sss.models import save_nussl_model
+
 RANK = 96
 test_folder = Path("database/test")
 
-def save_model(model, label):
+
+def export_model(model, stft_params: nussl.STFTParams, sample_rate, label):
+    metadata = {
+        "n_fft": stft_params.window_length,
+        "hop_length": stft_params.hop_length,
+        "window_type": stft_params.window_type,
+        "sample_rate": sample_rate,
+        "solver": {"solver": model.solver, "beta_loss": model.beta_loss, "tol": model.tol,
+                   "max_iter": model.max_iter, "alpha_W": model.alpha_W, "alpha_H": model.alpha_H,
+                   "l1_ratio": model.l1_ratio}
+    }
+    output_path = save_nussl_model(model.components_, metadata, Instrument(label))
+    print(f"Model exported to {output_path}")
+
+
+def export_pickled_model(label):
     default_folder = Path("train/nmf_models")
-    input_path = default_folder / f"{label}.pk1"
-    with open(input_path, "wb") as file:
-        pickle.dump(model, file, pickle.HIGHEST_PROTOCOL)
-        print(f"Model saved to {input_path}")
+    with open(default_folder / f"{label}.pk1", "rb") as file:
+        model, _, _ = pickle.load(file)
+    # pickled models were fitted with the default STFT parameters of 44.1 kHz signals
+    stft_params = nussl.STFTParams(window_length=2048, hop_length=512, window_type=nussl.constants.WINDOW_DEFAULT)
+    export_model(model, stft_params, 44_100, label)
+
+
+def train_signals(extract_type):
+    files_depth_2 = glob.glob("*/*", root_dir=test_folder)
+    return [nussl.AudioSignal(os.path.join(test_folder, audio_path))
+            for audio_path in files_depth_2 if extract_type in audio_path][:3]
 
 
 if __name__=="__main__":
     for extract_type in ["bass", "drums", "vocals"]:
-        files_depth_2 = glob.glob("*/*", root_dir=test_folder)
-        audio_signals = [nussl.AudioSignal(os.path.join(test_folder, audio_path)) 
-                         for audio_path in files_depth_2 if extract_type in audio_path][:3]
-        model = nussl.separation.NMFMixin.fit(audio_signals=audio_signals, n_components=RANK)
-        save_model(model, extract_type)
-        
-        
-        
\ No newline at end of file
+        if "--from-pickle" in sys.argv:
+            export_pickled_model(extract_type)
+            continue
+        audio_signals = train_signals(extract_type)
+        model, _, _ = nussl.separation.NMFMixin.fit(audio_signals=audio_signals, n_components=RANK)
+        export_model(model, audio_signals[0].stft_params, audio_signals[0].sample_rate, extract_type)
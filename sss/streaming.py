@@ -0,0 +1,33 @@
+from typing import Callable
+
+import numpy as np
+import soundfile as sf
+
+from sss.dataclasses import AudioWave, Pathname
+
+
+def stream_separation(input_path: Pathname, separate: Callable[[AudioWave], list[AudioWave]],
+                      outputs: list[sf.SoundFile], block_size: int, overlap: int, dtype: str = "float64"):
+    """
+    Separates the input block by block and writes every result to its output as soon as it is ready.
+    Consecutive blocks share `overlap` samples, which are linearly cross-faded, so memory use
+    depends only on the block size and not on the track length.
+    """
+    fade_in = ((np.arange(overlap, dtype=dtype) + 0.5) / overlap)[:, np.newaxis]
+    tails = None
+    for block in sf.blocks(input_path, blocksize=block_size + overlap, overlap=overlap, dtype=dtype, always_2d=True):
+        waves = separate(block)
+        if tails is not None:
+            waves = [crossfade(tail, wave, fade_in) for tail, wave in zip(tails, waves)]
+        split = max(len(block) - overlap, 0)
+        for output, wave in zip(outputs, waves):
+            output.write(wave[:split])
+        tails = [wave[split:] for wave in waves]
+    for output, tail in zip(outputs, tails or []):
+        output.write(tail)
+
+
+def crossfade(tail: AudioWave, wave: AudioWave, fade_in: np.ndarray) -> AudioWave:
+    length = min(len(tail), len(wave))
+    wave[:length] = tail[:length] * (1 - fade_in[:length]) + wave[:length] * fade_in[:length]
+    return wave
@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+import time
+
+from sss.batch import collect_tracks, run_batch, print_summary
+from sss.commander import OUTPUT_FORMATS
+from sss.dataclasses import ExtractParams, BatchParams, ExtractionType
+
+import click
+
+
+@click.command()
+@click.option('-t', '--extraction-type', default='vocals', help='type of the extraction',
+              type=click.Choice(ExtractionType.__members__),
+              callback=lambda _c, _p, v: getattr(ExtractionType, v) if v else None)
+@click.option('-m', '--method', default='nmf', help='extraction method',
+              type=click.Choice(['nmf', 'demucs', 'demucs-cli', 'nussl'], case_sensitive=False))
+@click.option('-q', '--quality', default='normal', help='choose extraction quality',
+              type=click.Choice(['fast', 'normal', 'high'], case_sensitive=False))
+@click.option('--reverse/--no-reverse', '-r/', default=False, help='reversed extraction')
+@click.option('-I', '--max-iter', default=None, type=click.IntRange(1,), help='maximum iterations number')
+@click.option('--tol', default=None, type=click.FloatRange(0,),
+              help='relative loss decrease below which nmf stops early (0 disables, default depends on quality)')
+@click.option('--joint/--no-joint', default=False, help='decompose all instruments at once with a stacked dictionary (nmf)')
+@click.option('--evaluate/--no-evaluate', default=False,
+              help='evaluate every stem against <instrument>.wav found next to its track')
+@click.option('--eval-mode', default='bss', type=click.Choice(['bss', 'fast']),
+              help='bss: full BSS-eval with museval, fast: framewise SI-SDR only, other metrics left empty')
+@click.option('-w', '--workers', default=1, type=click.IntRange(1,), help='number of tracks separated in parallel')
+@click.option('--precision', default='float64', type=click.Choice(['float32', 'float64']),
+              help='float precision of audio, spectrograms and dictionaries (nmf), float32 halves memory traffic')
+@click.option('--cache-dir', default=None, type=click.Path(file_okay=False),
+              help='reuse results of identical separations stored in this directory')
+@click.option('--cache-size', default=2048, type=click.IntRange(1,), help='cache size limit in MB')
+@click.option('-f', '--output-format', default='wav', type=click.Choice(OUTPUT_FORMATS),
+              help='format of the separated stems: 24-bit wav or flac, or raw float32 npy')
+@click.option('-o', '--output-path', default="results", type=click.Path(file_okay=False), help='output directory')
+@click.argument('inputs', nargs=-1, required=True)
+def sss_batch_command(extraction_type, method, quality, reverse, max_iter, tol, joint, evaluate, eval_mode, workers,
+                      precision, cache_dir, cache_size, output_format, output_path, inputs):
+    """Separates every track given as INPUTS: directories, glob patterns or manifests with one path per line."""
+    tracks = collect_tracks(list(inputs))
+    extract_parameters = ExtractParams(
+        input_path=None,
+        instruments=extraction_type.to_instrument(),
+        reverse=ExtractParams.should_reverse(reverse, extraction_type),
+        quality=quality,
+        max_iter=max_iter,
+        joint=joint,
+        tol=tol,
+        cache_dir=cache_dir,
+        cache_size=cache_size,
+        precision=precision
+    )
+    batch_parameters = BatchParams(method=method, extract_params=extract_parameters, output_path=output_path,
+                                   evaluate=evaluate, eval_mode=eval_mode, workers=workers,
+                                   output_format=output_format)
+
+    start = time.perf_counter()
+    reports = run_batch(tracks, batch_parameters)
+    print_summary(reports, time.perf_counter() - start)
+
+
+# ./sss_batch.py -t full -w 8 -o results --evaluate "database/test/*/mixture.wav"
+if __name__ == "__main__":
+    sss_batch_command()
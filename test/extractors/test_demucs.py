@@ -1,12 +1,38 @@
+import random
+import shlex
+import shutil
+import tempfile
 import unittest
+from unittest.mock import patch, MagicMock
 
 import numpy as np
+import torch as th
+from demucs.apply import apply_model
 
 import sss.extractors.demucs as demucs
-from sss.dataclasses import ExtractParams, Instrument
+from sss.dataclasses import ExtractParams, SaveWavParams, InputAudio, Instrument
 
 from test.utils import *
 
+
+class StubModel(th.nn.Module):
+    """Stands in for a pretrained model: every source is the mixture scaled by a ramp over the model input."""
+    sources = ["drums", "bass", "other", "vocals"]
+    samplerate = 44_100
+    audio_channels = 2
+    segment = 1.0
+
+    def __init__(self, name: str = None, device: str = None):
+        super().__init__()
+
+    def forward(self, mix):
+        ramp = th.linspace(0.5, 1.5, mix.shape[-1])
+        return th.stack([mix * ramp * (index + 1) / 10 for index in range(len(self.sources))], dim=1)
+
+def output_root_of(command: str) -> str:
+    arguments = shlex.split(command)
+    return arguments[arguments.index("-o") + 1]
+
 # Should demucs itself be mocked?
 class TestDemucs(unittest.TestCase):
     def test_extraction(self):
@@ -39,5 +65,155 @@ class TestDemucs(unittest.TestCase):
         #cleanup
         delete_stub_audiowave(stub_path)
 
+    @patch.object(demucs, "get_model")
+    def test_model_loaded_on_gpu_when_available(self, get_model):
+        # given
+        get_model.return_value = MagicMock()
+
+        # when
+        with patch.object(th.cuda, "is_available", return_value=True):
+            demucs.load_model.__wrapped__()
+        demucs.load_model.__wrapped__(device="cpu")
+
+        # then
+        self.assertEqual([args for args, _ in get_model.return_value.to.call_args_list], [("cuda",), ("cpu",)],
+                         "Shift workers keep their model on the CPU")
+
+    @patch.object(demucs, "load_model", StubModel)
+    def test_extraction_keeps_input_format(self):
+        # given
+        stub_audiowave = np.random.default_rng(0).random((48_000, 1)) - 0.5
+        params = ExtractParams(
+            input_path="not_decoded_again.wav",
+            instruments=[Instrument("vocals"), Instrument("drums")],
+            reverse=True,
+            quality="fast",
+            max_iter=None,
+            audio=InputAudio(stub_audiowave, 48_000)
+        )
+
+        # when
+        actual_result = demucs.perform_demucs(params)
+
+        # then
+        self.assertEqual([instr for instr, _ in actual_result],
+                         [Instrument("vocals"), Instrument("drums"), Instrument("other")])
+        for _, actual_wave in actual_result:
+            self.assertEqual(actual_wave.shape, stub_audiowave.shape,
+                             "Stems have the input's length and channels, not the model's")
+
+    @patch.object(demucs, "load_model", StubModel)
+    def test_parallel_shifts(self):
+        # given
+        shifts = 4
+        model = StubModel()
+        wav = th.from_numpy(np.random.default_rng(0).random((2, SR // 2), dtype=np.float32) - 0.5)
+        random.seed(1234)
+        seeds = [random.randrange(2 ** 32) for _ in range(shifts)]
+        # the offsets every seeded single-shift pass draws, fed to one serial pass over all shifts
+        max_shift = int(0.5 * model.samplerate)
+        offsets = [random.Random(seed).randint(0, max_shift) for seed in seeds]
+        with patch("demucs.apply.random.randint", side_effect=offsets):
+            expected = apply_model(model, wav[None], shifts=shifts, split=True, overlap=0.25)[0]
+
+        # when
+        random.seed(1234)
+        try:
+            actual = demucs.apply_shifts(model, wav, shifts, jobs=2)
+        finally:
+            #cleanup
+            demucs.shift_pool(2).shutdown()
+            demucs.shift_pool.cache_clear()
+
+        # then
+        np.testing.assert_allclose(actual.numpy(), expected.numpy(), rtol=1e-5, atol=1e-6)
+
+    @patch.object(demucs, "load_model", StubModel)
+    def test_streaming_extraction_with_silence(self):
+        # given
+        stub_dir = tempfile.mkdtemp()
+        stub_path = os.path.join(stub_dir, "stub_stream.wav")
+        stub_audiowave = np.random.default_rng(0).random((int(3.3 * SR), 2)) - 0.5
+        stub_audiowave[SR:int(2.9 * SR)] = 0  # the window at 1.8-2.8 s is silent, the one from 2.7 s is short
+        save_stub_audiowave(stub_audiowave, stub_path)
+        params = ExtractParams(
+            input_path=stub_path,
+            instruments=[Instrument("vocals")],
+            reverse=True,
+            quality="fast",
+            max_iter=None,
+            segment=1.0
+        )
+        # float32 npy keeps NaN, which 24-bit wav would hide
+        save_params = SaveWavParams(sample_rate=SR, input_track="stub", output_path=stub_dir, output_format="npy")
+
+        # when
+        actual_result = demucs.stream_demucs(params, save_params)
+
+        # then
+        try:
+            self.assertEqual([instr for instr, _ in actual_result], [Instrument("vocals"), Instrument("other")])
+            for _, actual_path in actual_result:
+                actual_wave = np.load(actual_path + ".npy")
+                self.assertEqual(actual_wave.shape, stub_audiowave.shape, "Streamed result keeps the input length")
+                self.assertFalse(np.isnan(actual_wave).any(), "Silent windows do not turn into NaN")
+                self.assertTrue(np.allclose(actual_wave[int(1.9 * SR):int(2.7 * SR)], 0, atol=1e-4),
+                                "Silence stays silent")
+        finally:
+            #cleanup
+            shutil.rmtree(stub_dir)
+
+    def test_cli_extraction_in_own_output_root(self):
+        # given
+        output_roots = []
+        stub_wave = np.random.default_rng(0).random((1000, 2)) - 0.5
+        params = ExtractParams(
+            input_path="song.wav",
+            instruments=[Instrument("vocals")],
+            reverse=True,
+            quality="fast",
+            max_iter=None
+        )
+
+        def run_demucs(command):
+            output_root = output_root_of(command)
+            output_roots.append(output_root)
+            stems_dir = os.path.join(output_root, demucs.MODEL_NAME, "song")
+            os.makedirs(stems_dir)
+            save_stub_audiowave(stub_wave, os.path.join(stems_dir, "vocals.wav"))
+            save_stub_audiowave(stub_wave / 2, os.path.join(stems_dir, "no_vocals.wav"))
+            return 0
+
+        # when
+        with patch.object(demucs.os, "system", side_effect=run_demucs):
+            first_result = demucs.perform_demucs_cli(params)
+            demucs.perform_demucs_cli(params)
+
+        # then
+        self.assertEqual(len(set(output_roots)), 2, "Every call separates into its own output root")
+        self.assertEqual([instr for instr, _ in first_result], [Instrument("vocals"), Instrument("other")])
+        np.testing.assert_allclose(first_result[0][1], stub_wave, atol=1e-4)
+        np.testing.assert_allclose(first_result[1][1], stub_wave / 2, atol=1e-4)
+        for output_root in output_roots:
+            self.assertFalse(os.path.exists(output_root), "Output root is removed once the stems are read")
+
+    def test_failed_cli_extraction_removes_output_root(self):
+        # given
+        output_roots = []
+        params = ExtractParams(input_path="song.wav", instruments=[Instrument("vocals")], reverse=False,
+                               quality="fast", max_iter=None)
+
+        def run_demucs(command):
+            output_roots.append(output_root_of(command))
+            os.makedirs(os.path.join(output_roots[-1], demucs.MODEL_NAME, "song"))
+            return 256
+
+        # when
+        with patch.object(demucs.os, "system", side_effect=run_demucs), self.assertRaises(Exception):
+            demucs.perform_demucs_cli(params)
+
+        # then
+        self.assertFalse(os.path.exists(output_roots[0]), "Partial output of a failed run is removed")
+
 if __name__=='__main__':
-    unittest.main()
\ No newline at end of file
+    unittest.main()
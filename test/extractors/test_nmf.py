@@ -1,9 +1,12 @@
+import shutil
 import unittest
+from unittest.mock import patch
 
 import numpy as np
 
 import sss.extractors.nmf as nmf
-from sss.dataclasses import ExtractParams, Instrument
+from sss.dataclasses import ExtractParams, SaveWavParams, InputAudio, Instrument
+from sss.persistance import load_activations
 
 from test.utils import *
 
@@ -39,5 +42,294 @@ class TestNmf(unittest.TestCase):
         #cleanup
         delete_stub_audiowave(stub_path)
 
+    def test_joint_extraction(self):
+        # given
+        stub_audiowave = np.arange(100_000, dtype="float64").reshape((-1, 2)) / 100_000
+        stub_path = "stub_path_joint.wav"
+        save_stub_audiowave(stub_audiowave, stub_path)
+        params = ExtractParams(
+            input_path=stub_path,
+            instruments=[Instrument("vocals"), Instrument("bass"), Instrument("drums")],
+            reverse=False,
+            quality="fast",
+            max_iter=1,
+            joint=True
+        )
+
+        # when
+        actual_result = nmf.perform_nmf(params)
+
+        # then
+        self.assertListEqual([instr for instr, _ in actual_result], params.instruments)
+        for _, actual_wave in actual_result:
+            self.assertEqual(actual_wave.shape[1], 2, "Audiowaves are stereo (two channels)")
+
+        #cleanup
+        delete_stub_audiowave(stub_path)
+
+    def test_mono_extraction(self):
+        # given
+        stub_audiowave = np.arange(50_000, dtype="float64") / 50_000
+        stub_path = "stub_path_mono.wav"
+        save_stub_audiowave(stub_audiowave, stub_path)
+        params = ExtractParams(
+            input_path=stub_path,
+            instruments=[Instrument("vocals")],
+            reverse=True,
+            quality="fast",
+            max_iter=1
+        )
+
+        # when
+        actual_result = nmf.perform_nmf(params)
+
+        # then
+        self.assertEqual(len(actual_result), 2)
+        for _, actual_wave in actual_result:
+            self.assertEqual(actual_wave.shape[1], 1, "Audiowaves keep the single input channel")
+
+        #cleanup
+        delete_stub_audiowave(stub_path)
+
+    def test_extraction_from_decoded_audio(self):
+        # given
+        stub_audiowave = np.random.default_rng(0).random((50_000, 2)) - 0.5
+        params = ExtractParams(
+            input_path="not_decoded_again.wav",
+            instruments=[Instrument("vocals")],
+            reverse=False,
+            quality="fast",
+            max_iter=1,
+            audio=InputAudio(stub_audiowave, 44100)
+        )
+
+        # when
+        actual_result = nmf.perform_nmf(params)
+
+        # then
+        self.assertEqual(len(actual_result), 1)
+        self.assertEqual(actual_result[0][1].shape, stub_audiowave.shape, "Already decoded audio is separated")
+
+    def test_float32_extraction(self):
+        # given
+        stub_audiowave = np.random.default_rng(0).random((50_000, 2)) - 0.5
+        params = ExtractParams(
+            input_path="not_decoded_again.wav",
+            instruments=[Instrument("vocals")],
+            reverse=True,
+            quality="fast",
+            max_iter=5,
+            precision="float32",
+            audio=InputAudio(stub_audiowave, 44100)
+        )
+
+        # when
+        actual_result = nmf.perform_nmf(params)
+
+        # then
+        for _, actual_wave in actual_result:
+            self.assertEqual(actual_wave.dtype, np.float32, "Audiowaves are not upcast")
+
+    def test_iterative_extraction(self):
+        # given
+        stub_audiowave = np.random.default_rng(0).random((50_000, 2)) - 0.5
+        params = ExtractParams(
+            input_path="not_decoded_again.wav",
+            instruments=[Instrument("vocals"), Instrument("drums")],
+            reverse=True,
+            quality="fast",
+            max_iter=1,
+            audio=InputAudio(stub_audiowave, 44100)
+        )
+
+        # when
+        stems = nmf.iter_nmf(params)
+        first_instrument, first_wave = next(stems)
+
+        # then
+        self.assertEqual(first_instrument, Instrument("vocals"), "First stem is handed over before the others")
+        self.assertEqual(first_wave.shape, stub_audiowave.shape)
+        self.assertEqual([instrument for instrument, _ in stems], [Instrument("drums"), Instrument("other")])
+
+    def test_streaming_extraction(self):
+        # given
+        stub_audiowave = np.arange(100_000, dtype="float64").reshape((-1, 2)) / 100_000
+        stub_path = "stub_path_stream.wav"
+        stub_output_folder = "stub_stream_folder"
+        save_stub_audiowave(stub_audiowave, stub_path)
+        params = ExtractParams(
+            input_path=stub_path,
+            instruments=[Instrument("vocals")],
+            reverse=True,
+            quality="fast",
+            max_iter=1
+        )
+        save_params = SaveWavParams(sample_rate=SR, input_track="stub", output_path=stub_output_folder)
+
+        try:
+            # when
+            actual_result = nmf.stream_nmf(params, save_params)
+
+            # then
+            self.assertListEqual([instr for instr, _ in actual_result], [Instrument("vocals"), Instrument("other")])
+            for _, actual_path in actual_result:
+                self.assertEqual(sf.info(actual_path + ".wav").frames, len(stub_audiowave), "Streamed result keeps the input length")
+        finally:
+            #cleanup
+            delete_stub_audiowave(stub_path)
+            shutil.rmtree(stub_output_folder)
+
+    def test_parallel_extraction(self):
+        # given
+        stub_audiowave = np.arange(100_000, dtype="float64").reshape((-1, 2)) / 100_000
+        stub_path = "stub_path_parallel.wav"
+        save_stub_audiowave(stub_audiowave, stub_path)
+        params_for_jobs = lambda jobs: ExtractParams(
+            input_path=stub_path,
+            instruments=[Instrument("vocals")],
+            reverse=True,
+            quality="fast",
+            max_iter=5,
+            tol=0,
+            jobs=jobs
+        )
+
+        # when
+        serial_result = nmf.perform_nmf(params_for_jobs(1))
+        parallel_result = nmf.perform_nmf(params_for_jobs(2))
+
+        # then
+        for (_, serial_wave), (_, parallel_wave) in zip(serial_result, parallel_result):
+            np.testing.assert_allclose(parallel_wave, serial_wave, atol=1e-12)
+
+        #cleanup
+        delete_stub_audiowave(stub_path)
+
+    def test_activations_refined_by_next_run(self):
+        # given
+        stub_audiowave = np.random.default_rng(0).random((50_000, 2)) - 0.5
+        stub_path = "stub_path_activations.wav"
+        stub_activations_dir = "stub_activations_folder"
+        save_stub_audiowave(stub_audiowave, stub_path)
+        params_for_quality = lambda quality, precision="float64": ExtractParams(
+            input_path=stub_path,
+            instruments=[Instrument("vocals")],
+            reverse=False,
+            quality=quality,
+            max_iter=None,
+            tol=0,
+            activations_dir=stub_activations_dir,
+            precision=precision
+        )
+
+        try:
+            # when
+            nmf.perform_nmf(params_for_quality("fast"))
+            with patch.object(nmf, "fixed_dictionary_nmf", wraps=nmf.fixed_dictionary_nmf) as solver:
+                nmf.perform_nmf(params_for_quality("normal"))
+            _, iterations = load_activations(nmf.activations_path(params_for_quality("normal")))
+
+            # then
+            self.assertEqual(solver.call_args.args[2], 180, "Only the iterations left after the fast run are done")
+            self.assertEqual(iterations, [200])
+            self.assertNotEqual(nmf.activations_path(params_for_quality("normal", "float32")),
+                                nmf.activations_path(params_for_quality("normal")),
+                                "Activations of another precision are not refined")
+        finally:
+            #cleanup
+            delete_stub_audiowave(stub_path)
+            shutil.rmtree(stub_activations_dir)
+
+    def test_activations_of_other_dictionaries_not_refined(self):
+        # given
+        stub_path = "stub_path_dictionaries.wav"
+        save_stub_audiowave(np.zeros((1000, 2)), stub_path)
+        params = ExtractParams(input_path=stub_path, instruments=[Instrument("vocals")], reverse=False,
+                               quality="fast", max_iter=None, activations_dir="stub_activations_folder")
+
+        # when
+        original_path = nmf.activations_path(params)
+        with patch.object(nmf, "model_version", return_value="vocals.npy:1:retrained"):
+            retrained_path = nmf.activations_path(params)
+
+        # then
+        self.assertNotEqual(retrained_path, original_path, "Retrained dictionaries start from fresh activations")
+
+        #cleanup
+        delete_stub_audiowave(stub_path)
+
+    def test_fixed_dictionary_nmf(self):
+        # given
+        rng = np.random.default_rng(0)
+        W = rng.random((20, 4))
+        V = W @ rng.random((4, 30))
+        kl_divergence = lambda H: np.sum(V * np.log(V / (W @ H)) - V + W @ H)
+
+        # when
+        H_short, _ = nmf.fixed_dictionary_nmf(V, W, max_iter=5)
+        H_long, _ = nmf.fixed_dictionary_nmf(V, W, max_iter=200)
+
+        # then
+        self.assertEqual(H_long.shape, (4, 30))
+        self.assertTrue(np.all(H_long >= 0), "Activations are non-negative")
+        self.assertLess(kl_divergence(H_long), kl_divergence(H_short), "More iterations fit the spectrogram better")
+
+    def test_fixed_dictionary_nmf_early_stopping(self):
+        # given
+        rng = np.random.default_rng(0)
+        W = rng.random((20, 4))
+        V = W @ rng.random((4, 30))
+
+        # when
+        _, n_iter_without_tol = nmf.fixed_dictionary_nmf(V, W, max_iter=1000)
+        _, n_iter_with_tol = nmf.fixed_dictionary_nmf(V, W, max_iter=1000, tol=1e-3)
+
+        # then
+        self.assertEqual(n_iter_without_tol, 1000)
+        self.assertLess(n_iter_with_tol, 1000, "Iterations stop once the loss plateaus")
+
+    def test_fixed_dictionary_nmf_warm_start(self):
+        # given
+        rng = np.random.default_rng(0)
+        W = rng.random((20, 4))
+        V = W @ rng.random((4, 30))
+
+        # when
+        H_first_run, _ = nmf.fixed_dictionary_nmf(V, W, max_iter=10)
+        H_refined, _ = nmf.fixed_dictionary_nmf(V, W, max_iter=10, H_init=H_first_run)
+        H_single_run, _ = nmf.fixed_dictionary_nmf(V, W, max_iter=20)
+
+        # then
+        np.testing.assert_allclose(H_refined, H_single_run, err_msg="Refining continues where the first run stopped")
+
+    def test_reversed_spectrogram_without_stems_is_mixture(self):
+        # given
+        rng = np.random.default_rng(0)
+        mixture = rng.standard_normal((2, 65, 40)) + 1j * rng.standard_normal((2, 65, 40))
+        cache = nmf.SpectrogramCache(mixture=mixture)
+        cache.stems.append(np.zeros(mixture.shape))
+
+        # when
+        other = nmf.NMFSeparator.compute_reversed_spectrogram(cache)
+
+        # then
+        np.testing.assert_allclose(cache.magnitude, np.abs(mixture), err_msg="Magnitude is computed once from the mixture")
+        np.testing.assert_allclose(other, mixture, atol=2 * nmf.EPS, err_msg="Nothing extracted leaves the whole mixture")
+
+    def test_reversed_spectrogram_never_exceeds_mixture(self):
+        # given
+        rng = np.random.default_rng(0)
+        mixture = rng.standard_normal((2, 65, 40)) + 1j * rng.standard_normal((2, 65, 40))
+        cache = nmf.SpectrogramCache(mixture=mixture)
+        cache.stems.extend([rng.random(mixture.shape), rng.random(mixture.shape)])
+
+        # when
+        other = nmf.NMFSeparator.compute_reversed_spectrogram(cache)
+
+        # then
+        self.assertTrue(np.all(np.abs(other) <= cache.magnitude), "Residual magnitude is bounded by the mixture")
+        np.testing.assert_allclose(np.angle(other[other != 0]), np.angle(mixture[other != 0]),
+                                   err_msg="Residual keeps the mixture phase")
+
 if __name__=='__main__':
     unittest.main()
\ No newline at end of file
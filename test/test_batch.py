@@ -0,0 +1,107 @@
+import shutil
+import tempfile
+import unittest
+from concurrent.futures import Future
+from pathlib import Path
+from unittest.mock import patch
+
+from sss import batch
+from sss.batch import TrackReport
+from sss.dataclasses import BatchParams, ExtractParams, Instrument
+
+
+class TestBatch(unittest.TestCase):
+    def setUp(self):
+        self.root = Path(tempfile.mkdtemp())
+        for album in ("first", "second"):
+            (self.root / album).mkdir()
+            (self.root / album / "mixture.wav").touch()
+        (self.root / "second" / "notes.md").touch()
+
+    def tearDown(self):
+        #cleanup
+        shutil.rmtree(self.root)
+
+    def test_collect_tracks(self):
+        # given
+        manifest = self.root / "tracks.txt"
+        manifest.write_text("# test set\nfirst/mixture.wav\n\n")
+
+        # when
+        from_directory = batch.collect_tracks([str(self.root)])
+        from_glob = batch.collect_tracks([str(self.root / "*" / "mixture.wav")])
+        from_manifest = batch.collect_tracks([str(manifest)])
+
+        # then
+        expected = [str(self.root / "first" / "mixture.wav"), str(self.root / "second" / "mixture.wav")]
+        self.assertEqual(from_directory, expected, "Only audio files are collected from directories")
+        self.assertEqual(from_glob, expected)
+        self.assertEqual(from_manifest, [str(self.root / "first" / "mixture.wav")],
+                         "Manifest paths are relative to the manifest, comments and blank lines are skipped")
+
+    def test_track_names(self):
+        # given
+        tracks = ["a/mixture.wav", "b/mixture.wav", "c/song.wav"]
+
+        # when
+        names = batch.track_names(tracks)
+
+        # then
+        self.assertEqual(names, ["a-mixture", "b-mixture", "song"])
+
+    def test_matches_reference(self):
+        # given
+        full = [Instrument("vocals"), Instrument("bass"), Instrument("drums")]
+        karaoke = [Instrument("vocals")]
+
+        # then
+        self.assertTrue(batch.matches_reference(Instrument("other"), full), "Full extraction residual is the other stem")
+        self.assertFalse(batch.matches_reference(Instrument("other"), karaoke),
+                         "Karaoke residual is the whole accompaniment, not the other stem")
+        self.assertTrue(batch.matches_reference(Instrument("vocals"), karaoke))
+
+    def test_failed_track_is_reported(self):
+        # given
+        broken = self.root / "first" / "mixture.wav"
+        params = ExtractParams(input_path=None, instruments=[Instrument("vocals")], reverse=False,
+                               quality="fast", max_iter=1)
+
+        # when
+        reports = batch.run_batch([str(broken)], BatchParams("nmf", params, output_path=str(self.root / "out")))
+
+        # then
+        self.assertEqual(len(reports), 1)
+        self.assertIsNotNone(reports[0].error, "Failure of one track does not abort the batch")
+
+    def test_failed_tracks_are_reported_by_parallel_workers(self):
+        # given
+        broken = [str(self.root / album / "mixture.wav") for album in ("first", "second")]
+        params = ExtractParams(input_path=None, instruments=[Instrument("vocals")], reverse=False,
+                               quality="fast", max_iter=1)
+
+        # when
+        reports = batch.run_batch(broken, BatchParams("nmf", params, output_path=str(self.root / "out"), workers=2))
+
+        # then
+        self.assertEqual([report.track for report in reports], broken, "Reports are in track order")
+        for report in reports:
+            self.assertIsNotNone(report.error)
+
+    def test_saves_overlap_with_next_track(self):
+        # given
+        failed_save = Future()
+        reports = {"first": TrackReport("first", 1.0, pending=[failed_save]), "second": TrackReport("second", 1.0)}
+
+        def process_track(track, _track_name):
+            if track == "second":
+                self.assertEqual(reports["first"].pending, [failed_save], "Saves are not waited for before the next track")
+                failed_save.set_exception(OSError("disk full"))
+            return reports[track]
+
+        # when
+        with patch.object(batch, "process_track", side_effect=process_track):
+            actual_reports = batch.process_tracks([("first", "first"), ("second", "second")])
+
+        # then
+        self.assertEqual(actual_reports[0].error, "OSError: disk full", "Failed save fails its own track")
+        self.assertIsNone(actual_reports[1].error)
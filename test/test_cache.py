@@ -0,0 +1,77 @@
+import os
+import shutil
+import tempfile
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+import numpy as np
+
+from sss import cache
+from sss.dataclasses import ExtractParams, InputAudio, Instrument
+
+
+class TestCache(unittest.TestCase):
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        #cleanup
+        shutil.rmtree(self.cache_dir)
+
+    def test_store_and_load_results(self):
+        # given
+        results = [(Instrument("vocals"), np.ones((100, 2))), (Instrument("other"), np.zeros((100, 2)))]
+
+        # when
+        cache.store_results(self.cache_dir, "key", results, max_size_mb=1)
+        cached = cache.load_cached_results(self.cache_dir, "key")
+
+        # then
+        self.assertEqual([instrument for instrument, _ in cached], [Instrument("vocals"), Instrument("other")])
+        for (_, expected), (_, actual) in zip(results, cached):
+            np.testing.assert_array_equal(actual, expected)
+        self.assertIsNone(cache.load_cached_results(self.cache_dir, "missing"))
+
+    def test_decoded_audio_is_not_cached(self):
+        # given
+        params = ExtractParams(input_path="unrelated.wav", instruments=[Instrument("vocals")], reverse=False,
+                               quality="fast", max_iter=1, audio=InputAudio(np.zeros((100, 2)), 44100))
+
+        # then
+        with self.assertRaises(ValueError, msg="The input path may not match the decoded audio"):
+            cache.cache_key("nmf", params)
+
+    def test_least_recently_used_entries_are_evicted(self):
+        # given
+        stems = [(Instrument("vocals"), np.ones(60_000))]  # ~470 KB each
+        cache.store_results(self.cache_dir, "first", stems, max_size_mb=1)
+        cache.store_results(self.cache_dir, "second", stems, max_size_mb=1)
+        os.utime(os.path.join(self.cache_dir, "first"), (0, 0))
+        os.utime(os.path.join(self.cache_dir, "second"), (1, 1))
+        cache.load_cached_results(self.cache_dir, "first")
+
+        # when
+        cache.store_results(self.cache_dir, "third", stems, max_size_mb=1)
+
+        # then
+        self.assertEqual(sorted(os.listdir(self.cache_dir)), ["first", "third"])
+
+    def test_eviction_skips_entries_removed_concurrently(self):
+        # given
+        stems = [(Instrument("vocals"), np.ones(60_000))]
+        cache.store_results(self.cache_dir, "first", stems, max_size_mb=1)
+        os.mkdir(os.path.join(self.cache_dir, "vanished"))
+        iterdir = Path.iterdir
+
+        def iterdir_vanishing(path):
+            if path.name == "vanished":
+                raise FileNotFoundError(path)
+            return iterdir(path)
+
+        # when
+        with patch.object(Path, "iterdir", iterdir_vanishing):
+            cache.store_results(self.cache_dir, "second", stems, max_size_mb=1)
+
+        # then
+        self.assertIsNotNone(cache.load_cached_results(self.cache_dir, "second"), "Store does not fail")
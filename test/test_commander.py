@@ -1,4 +1,4 @@
-import os, shutil
+import os, shutil, subprocess, sys
 import unittest
 from unittest.mock import patch
 
@@ -32,6 +32,17 @@ class TestCommander(unittest.TestCase):
         self.assertEqual(actual_audio_wave.shape[1], 2, "The output is a stereo file (two channels)")
         
         
+    def test_backends_are_imported_lazily(self):
+        # given
+        heavy_modules = ["librosa", "sklearn", "torch", "demucs", "nussl", "museval"]
+        check_imports = f"import sys, sss.commander; print([m for m in {heavy_modules} if m in sys.modules])"
+
+        # when
+        imported = subprocess.run([sys.executable, "-c", check_imports], capture_output=True, text=True, check=True)
+
+        # then
+        self.assertEqual(imported.stdout.strip(), "[]", "Importing the commander loads no extraction backend")
+
     def test_save(self):
         # given
         stub_track_name = "test"
@@ -78,6 +89,27 @@ class TestCommander(unittest.TestCase):
         self.assertTrue(mock_sf_read.called)
         
     
+    @patch('soundfile.read')
+    def test_evaluate_all(self, mock_sf_read):
+        # given
+        stub_audiowaves = [np.arange(200_000, dtype="float64").reshape(-1, 2) * scale for scale in (1, 2)]
+        params = [EvalParams("abcd.wav"), EvalParams("abcd.wav")]
+
+        # mock init
+        dummy_ref_audiowave = np.arange(1, 200_001, dtype="float64").reshape(-1, 2)
+        mock_sf_read.return_value = (dummy_ref_audiowave, 44100)
+
+        # when
+        actual_evaluations = commander.evaluate_all(stub_audiowaves, params, jobs=2)
+
+        # then
+        self.assertEqual(len(actual_evaluations), 2, "There is one evaluation per audiowave")
+        for actual_evaluation in actual_evaluations:
+            self.assertEqual(len(actual_evaluation), 4, "Evaluation consists of 4 types of metrics")
+
+        # mock check
+        self.assertEqual(mock_sf_read.call_count, 1, "Shared reference is read once")
+
     def test_save_eval(self):
         # given
         stub_output_path = "output_path"
@@ -0,0 +1,84 @@
+import io
+import unittest
+from contextlib import redirect_stdout
+from unittest.mock import patch
+
+import numpy as np
+
+from sss.dataclasses import EvalParams
+from sss.evaluation import evaluate_fast, ResultEvaluator, WINDOW
+
+
+class TestEvaluation(unittest.TestCase):
+    def setUp(self):
+        self.reference = np.random.default_rng(0).standard_normal((3 * WINDOW + 100, 2))
+
+    def test_evaluate_fast(self):
+        # given
+        noise = np.random.default_rng(1).standard_normal(self.reference.shape) * 0.1
+
+        # when
+        sdr, sir, sar, isr = evaluate_fast(self.reference, 0.5 * self.reference + noise)
+
+        # then
+        self.assertEqual(sdr.shape, (3,), "One score per full window, like museval")
+        np.testing.assert_allclose(sdr, 10 * np.log10(0.5 ** 2 / 0.1 ** 2), atol=0.2,
+                                   err_msg="Score does not depend on the estimate's scale")
+        for metric in (sir, sar, isr):
+            self.assertTrue(np.all(np.isnan(metric)), "Metrics other than SDR are not available")
+
+    def test_evaluate_fast_pads_estimate_and_skips_silence(self):
+        # given
+        self.reference[:WINDOW] = 0
+        estimate = self.reference[:2 * WINDOW + WINDOW // 2]
+
+        # when
+        sdr, *_ = evaluate_fast(self.reference, estimate)
+
+        # then
+        self.assertTrue(np.isnan(sdr[0]), "Silent reference window scores NaN")
+        self.assertEqual(sdr[1], np.inf, "Perfect estimate")
+        self.assertAlmostEqual(sdr[2], 0, delta=0.2, msg="Missing half of the estimate is zero-padded")
+
+    def test_evaluate_fast_scores_silent_estimate_lowest(self):
+        # given
+        estimate = self.reference.copy()
+        estimate[WINDOW:2 * WINDOW] = 0
+
+        # when
+        sdr, *_ = evaluate_fast(self.reference, estimate)
+
+        # then
+        self.assertEqual(sdr[1], -np.inf, "Silent estimate of a non-silent reference scores lowest")
+        self.assertEqual(sdr[0], np.inf)
+
+    @patch("sss.evaluation.sf.read")
+    def test_result_evaluator_reads_each_reference_once(self, read):
+        # given
+        read.return_value = (self.reference, 44100)
+        params = EvalParams("reference.wav", mode="fast")
+
+        # when
+        with ResultEvaluator() as evaluator:
+            evaluator.submit(self.reference, params)
+            evaluator.submit(0.5 * self.reference, params)
+            results = evaluator.results()
+
+        # then
+        read.assert_called_once_with("reference.wav")
+        self.assertEqual(len(results), 2, "One result per submitted wave, in submission order")
+        self.assertTrue(np.all(results[0][0] == np.inf))
+        np.testing.assert_allclose(results[1][0], results[0][0])
+        self.assertEqual(evaluator.results(), [], "Gathered results are not returned again")
+
+    def test_result_evaluator_without_results_is_silent(self):
+        # given
+        output = io.StringIO()
+
+        # when
+        with ResultEvaluator() as evaluator, redirect_stdout(output):
+            results = evaluator.results()
+
+        # then
+        self.assertEqual(results, [])
+        self.assertEqual(output.getvalue(), "", "Nothing is reported when no evaluation was requested")
@@ -0,0 +1,90 @@
+import json
+import shutil
+import tempfile
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+import numpy as np
+
+from sss import models
+from sss.dataclasses import Instrument
+
+
+class TestModels(unittest.TestCase):
+    def test_load_dictionary(self):
+        # when
+        dictionary = models.load_dictionary(Instrument("vocals"))
+
+        # then
+        self.assertTrue(models.dictionary_path(Instrument("vocals")).is_absolute())
+        self.assertIsInstance(dictionary, np.memmap, "Dictionary is memory-mapped")
+        self.assertFalse(dictionary.flags.writeable, "Shared dictionary is read-only")
+        self.assertIs(models.load_dictionary(Instrument("vocals")), dictionary, "Dictionary is loaded once per process")
+
+    def test_stacked_dictionary(self):
+        # given
+        instruments = (Instrument("vocals"), Instrument("drums"))
+
+        # when
+        stacked = models.stacked_dictionary(instruments)
+
+        # then
+        expected_rank = sum(models.load_dictionary(instrument).shape[1] for instrument in instruments)
+        self.assertEqual(stacked.shape[1], expected_rank)
+
+    def test_load_dictionary_in_float32(self):
+        # when
+        dictionary = models.load_dictionary(Instrument("vocals"), "float32")
+
+        # then
+        self.assertEqual(dictionary.dtype, np.float32)
+        self.assertFalse(dictionary.flags.writeable, "Shared dictionary is read-only")
+        self.assertIs(models.load_dictionary(Instrument("vocals"), "float32"), dictionary,
+                      "Converted dictionary is cached per precision")
+
+
+    def test_nussl_model_roundtrip(self):
+        # given
+        stub_models_dir = Path(tempfile.mkdtemp())
+        components = np.random.default_rng(0).random((4, 1025))
+        metadata = {"n_fft": 2048, "hop_length": 512, "window_type": "sqrt_hann", "sample_rate": 44_100,
+                    "solver": {"solver": "cd"}}
+
+        with patch.object(models, "MODELS_DIR", stub_models_dir):
+            models.load_nussl_model.cache_clear()
+            try:
+                # when
+                models.save_nussl_model(components, metadata, Instrument("bass"))
+                actual_model = models.load_nussl_model(Instrument("bass"))
+
+                # then
+                np.testing.assert_array_equal(actual_model.components, components)
+                self.assertEqual(actual_model.metadata["rank"], 4)
+                self.assertIsInstance(actual_model.components, np.memmap, "Components are memory-mapped")
+            finally:
+                #cleanup
+                models.load_nussl_model.cache_clear()
+                shutil.rmtree(stub_models_dir)
+
+    def test_nussl_model_version_check(self):
+        # given
+        stub_models_dir = Path(tempfile.mkdtemp())
+        with patch.object(models, "MODELS_DIR", stub_models_dir):
+            models.load_nussl_model.cache_clear()
+            path = models.save_nussl_model(np.ones((4, 1025)), {"n_fft": 2048}, Instrument("bass"))
+            with open(path.with_suffix(".json"), "w", encoding="UTF-8") as file:
+                json.dump({"format_version": models.NUSSL_MODEL_VERSION + 1, "rank": 4, "n_fft": 2048}, file)
+
+            try:
+                # when, then
+                with self.assertRaises(ValueError):
+                    models.load_nussl_model(Instrument("bass"))
+            finally:
+                #cleanup
+                models.load_nussl_model.cache_clear()
+                shutil.rmtree(stub_models_dir)
+
+
+if __name__=='__main__':
+    unittest.main()
@@ -0,0 +1,67 @@
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+import soundfile as sf
+
+from sss.dataclasses import SaveWavParams, Instrument
+from sss.persistance import AsyncWriter, OUTPUT_FORMATS, save_results, load_result, open_result_file
+
+
+class TestPersistance(unittest.TestCase):
+    def setUp(self):
+        self.output_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        #cleanup
+        shutil.rmtree(self.output_dir)
+
+    def test_async_writer(self):
+        # given
+        wave = np.random.default_rng(0).random((1000, 2)) - 0.5
+        save_params = SaveWavParams(sample_rate=44100, input_track="stub", output_path=self.output_dir)
+
+        # when
+        with AsyncWriter(workers=2, max_pending=1) as writer:
+            futures = [writer.save_results(wave, instrument, save_params)
+                       for instrument in (Instrument("vocals"), Instrument("drums"))]
+
+        # then
+        for future in futures:
+            self.assertTrue(future.done(), "Leaving the writer waits for all saves")
+            written, sample_rate = sf.read(future.result() + ".wav")
+            self.assertEqual(sample_rate, 44100)
+            np.testing.assert_allclose(written, wave, atol=1e-6)
+
+    def test_async_writer_flush_raises_failed_save(self):
+        # given
+        save_params = SaveWavParams(sample_rate=44100, input_track="stub", output_path=self.output_dir)
+        writer = AsyncWriter()
+
+        # when
+        writer.save_results(np.zeros((10, 2, 2)), Instrument("vocals"), save_params)
+
+        # then
+        with self.assertRaises(Exception):
+            writer.flush()
+        writer.flush()  # the error is raised once
+
+    def test_output_formats(self):
+        # given
+        wave = np.random.default_rng(0).random((1000, 2)) - 0.5
+
+        for output_format in OUTPUT_FORMATS:
+            save_params = SaveWavParams(sample_rate=44100, input_track="stub", output_path=self.output_dir,
+                                        output_format=output_format)
+
+            # when
+            saved_path = save_results(wave, Instrument("vocals"), save_params)
+            with open_result_file(Instrument("drums"), save_params, channels=2, frames=len(wave)) as output:
+                output.write(wave[:600])
+                output.write(wave[600:])
+
+            # then
+            for path in (saved_path, saved_path.replace("vocals", "drums")):
+                np.testing.assert_allclose(load_result(path, output_format), wave, atol=1e-6,
+                                           err_msg=f"{output_format} result is read back")